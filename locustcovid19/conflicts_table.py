@@ -11,14 +11,23 @@ Created on Thu Jun 24 13:36:40 2020
 import os
 import yaml
 import pandas as pd
-from utils.flat_files import FlatFiles
+from utils.flat_files import FlatFiles, date_key
+from utils.boundaries import get_boundaries
+from utils.csv_stream import read_csv_filtered
 import numpy as np
 import geopandas as gpd
-from datetime import datetime
 from shapely import wkt
 
 COUNTRIES = ["Kenya", "Somalia", "Ethiopia", "Uganda", "South Sudan", "Sudan"]
-COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
+CONFLICTS_COLUMNS = ['id', 'country', 'year', 'date_start', 'best', 'geom_wkt']
+
+def conflict_rows(chunk):
+    '''
+
+    :param chunk: A chunk of the UCDP events.
+    :return: A boolean mask of the events in the selected countries since 2000.
+    '''
+    return chunk['country'].isin(COUNTRIES) & (chunk['year'] >= 2000)
 
 class ConflictsTable:
     '''
@@ -30,59 +39,33 @@ class ConflictsTable:
         self.flats = FlatFiles(self.path_in, self.path_out)
 
     def load_conflicts(self):
-        conflicts_df = pd.read_csv(self.path_in + "/social_cohesion/conflicts/ged201.csv", sep=",", encoding='utf-8')
+        # The global file is streamed in chunks, only the events of the selected countries and years are kept
+        conflicts_df = read_csv_filtered(self.path_in + "/social_cohesion/conflicts/ged201.csv", conflict_rows,
+                                         CONFLICTS_COLUMNS, sep=",", encoding='utf-8')
         conflicts_df['geometry'] = conflicts_df['geom_wkt'].apply(wkt.loads)
         conflicts_gdf = gpd.GeoDataFrame(conflicts_df, crs='epsg:4326')
         return conflicts_gdf
 
     def filter_data(self):
+        # Countries and years are filtered while reading, see conflict_rows
         conflicts = self.load_conflicts()
-        # Filter countries
-        conflicts = conflicts[conflicts['country'].isin(COUNTRIES)]
-
-        #Filter years
-        conflicts = conflicts[conflicts['year'] >= 2000]
 
         #Filter columns
         conflicts = conflicts[['id', 'country', 'date_start', 'best', 'geometry']]
 
         return conflicts
 
-    def read_boundaries_shp(self, country, hierarchy):
-        '''
-
-        :param country: The reference country
-        :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
-        :return: A geodataframe with 2 columns: locationID and geometry.
-        '''
-        gdf_country = gpd.read_file(self.path_in + "/Spatial/gadm36_" + country + "_" + str(hierarchy) + ".shp")
-        GID_column = 'GID_' + str(hierarchy)
-        gdf_country = gdf_country[[GID_column, 'geometry']]
-        gdf_country = gdf_country.rename(columns={GID_column: 'locationID'})
-
-        return gdf_country
-
-    def get_districts(self):
-        all_districts = gpd.GeoDataFrame()
-        for country in COUNTRIES_IDS:
-            gdf_district = self.read_boundaries_shp(country, 2)
-            all_districts = all_districts.append(gdf_district)
-        all_districts.crs = {"init": "epsg:4326"}
-        return all_districts
-
     def add_ids(self):
         conflicts = self.filter_data()
 
         # Spatial join with districts and add locationID
-        districts = self.get_districts()
+        districts = get_boundaries(self.path_in, 2)[['locationID', 'geometry']]
         conflicts = gpd.sjoin(districts, conflicts, how='right', op='contains')
 
         # Add dateID
         conflicts['date'] = pd.to_datetime(conflicts['date_start'])
-        conflicts["date"] = [d.date() for d in conflicts["date"]]
-        #conflicts['date'] = conflicts['date'].apply(lambda x: datetime.strptime(x, '%Y-%m-%d'))
-        conflicts['dateID'] = conflicts['date'].apply(lambda x: datetime.strftime(x, '%Y%m%d'))
-        conflicts['dateID'] = conflicts['dateID'].astype(int)
+        conflicts['dateID'] = date_key(conflicts['date'])
+        conflicts["date"] = conflicts["date"].dt.date
 
         # Add value & factID per table (occurencies and deaths)
         occurencies = conflicts.copy().reset_index(drop=True)
@@ -109,7 +92,7 @@ class ConflictsTable:
         conflicts_df = self.add_ids()
         #self.flats.export_csv_w_date(conflicts_df, 'conflict_table')
         #self.flats.export_parquet_w_date(conflicts_df, 'conflict_table')
-        self.flats.export_to_parquet(conflicts_df, '/conflict_fact/conflict_table')
+        self.flats.export_fact_table(conflicts_df, '/conflict_fact/conflict_table')
 
 
 if __name__ == '__main__':
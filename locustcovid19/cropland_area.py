@@ -11,12 +11,14 @@ import os
 import pandas as pd
 import geopandas as gpd
 from utils.flat_files import FlatFiles
+from utils.boundaries import get_boundaries, boundary_areas
 from utils.s3_glob import s3_glob
-from rasterstats import zonal_stats
+from utils.s3_list import clear_listings
+from utils.s3_fetch import read_objects
+from utils.zonal import merge_tiles, cropland_value
+from utils.zone_index import tiles_district_counts
 import glob
-import boto3
 import yaml
-client = boto3.client('s3')
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -32,14 +34,6 @@ class Cropland:
         self.path_out = path_out
         self.flats = FlatFiles(self.path_in, self.path_out)
 
-        # Import districts
-        self.shp2_Kenya = gpd.read_file(self.path_in + "/Spatial/gadm36_KEN_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Somalia = gpd.read_file(self.path_in + "/Spatial/gadm36_SOM_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Ethiopia = gpd.read_file(self.path_in + "/Spatial/gadm36_ETH_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Uganda = gpd.read_file(self.path_in + "/Spatial/gadm36_UGA_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Sudan = gpd.read_file(self.path_in + "/Spatial/gadm36_SDN_2.shp")[['GID_2', 'geometry']]
-        self.shp2_SSudan = gpd.read_file(self.path_in + "/Spatial/gadm36_SSD_2.shp")[['GID_2', 'geometry']]
-
         # Import cropland vector
         #self.crops = gpd.read_file(self.path_in + "crops/Crops_vectorized.shp")
 
@@ -49,79 +43,95 @@ class Cropland:
         
         :return: A geodataframe with all districts of the 4 countries concatenated.
         '''
-        district_level = [self.shp2_Kenya, self.shp2_Ethiopia, self.shp2_Somalia, self.shp2_Uganda, self.shp2_Sudan, self.shp2_SSudan]
-        gdf_districts = gpd.GeoDataFrame(pd.concat(district_level, ignore_index=True))
-        gdf_districts['area'] = gdf_districts.geometry.area
-        gdf_districts.crs = {"init": "epsg:4326"}
+        gdf_districts = get_boundaries(self.path_in, 2)[['locationID', 'geometry']]
+        gdf_districts = gdf_districts.rename(columns={'locationID': 'GID_2'})
+        gdf_districts['area'] = boundary_areas(self.path_in, 2) # km²
         return gdf_districts
 
-    def get_stats(self, raster):
+    def raster_path(self, raster):
+        '''
+
+        :param raster: The name of the geotiff tile.
+        :return: The path of the geotiff indicating the cropland area.
         '''
+        return self.path_in + "/cropland/GFSAD30AFCE_2015_" + raster + "_001_2017261090100.tif"
 
+    def get_stats(self, raster, gdf_districts=None, stats=None):
+        '''
+        Counts the cropland pixels of the districts that intersect the raster.
         :param raster: The geotiff indicating the cropland area
-        :return: A df with two columns, district id and cropland area.
+        :param gdf_districts: The districts, read from the boundaries if not given.
+        :param stats: The pixel counts of the raster if already calculated, see utils.zone_index.tiles_district_counts.
+        :return: A df with the district id and area and the cropland and total pixel counts inside the raster.
         '''
         print("Processing raster " + raster)
-        raster_path = self.path_in + "/cropland/GFSAD30AFCE_2015_" + raster + "_001_2017261090100.tif"
-        gdf_districts = self.get_districts()
-
-        stats = zonal_stats(gdf_districts.geometry, raster_path,  layer="polygons", stats="count", categorical=True)
-
-        if raster == "N00E50":
-            gdf_districts['croplands_count'] = pd.DataFrame.from_dict(stats)[1]
-        #else:
-         #   gdf_districts['croplands_count'] = pd.DataFrame.from_dict(stats)[2]
-
-        elif raster in RASTER_NAMES:
-            try:
-                gdf_districts['croplands_count'] = pd.DataFrame.from_dict(stats)[2]
-            except:
-                print("Raster " + raster + " does not contain any croplands impacted by locust for the selected districts and dates.")
-                return
-        else:
+        if raster not in RASTER_NAMES:
             print("Raster not in RASTER_NAMES.")
             return
+        if gdf_districts is None:
+            gdf_districts = self.get_districts()
+        if stats is None:
+            stats = tiles_district_counts(self.path_in, {raster: self.raster_path(raster)},
+                                          {raster: cropland_value(raster)}, workers=1)[raster]
 
-        #print(raster)
-        gdf_districts['area_count'] = pd.DataFrame.from_dict(stats)["count"]
-        gdf_districts = gdf_districts[gdf_districts['croplands_count'].notnull()]
-        gdf_districts['croplands_area'] = gdf_districts['croplands_count'] * gdf_districts['area'] / gdf_districts[
-            'area_count']
+        df_districts = gdf_districts.loc[stats.index, ['GID_2', 'area']]
+        df_districts['croplands_count'] = stats['category_count']
+        df_districts['area_count'] = stats['area_count']
 
-        df_districts = gdf_districts[['GID_2', 'croplands_area']]
         file_name = "/cropland/crops_" + raster
         df_districts.to_csv(self.path_in + file_name + '.csv', sep='|', encoding='utf-8', index=False)
+        clear_listings(self.path_in + file_name + '.csv')
         print(raster + " raster exported.")
 
         return df_districts
 
+    def calc_croplands_area(self, counts):
+        '''
+        Adds up the pixel counts of the districts split between rasters and calculates their cropland area.
+        :param counts: A df with the pixel counts per district and raster.
+        :return: A df with two columns, district id and cropland area.
+        '''
+        crops_district = merge_tiles(counts, ['GID_2', 'area'])
+        crops_district = crops_district[crops_district['croplands_count'].notnull()]
+        crops_district['croplands_area'] = crops_district['croplands_count'] * crops_district['area'] / crops_district[
+            'area_count']
+
+        return crops_district[['GID_2', 'croplands_area']]
+
     def extract_crops(self):
         '''
         Function to run all zonal statistics for all rasters by calling get_stats.
-        :return: An appended df of all zonal statistics.
+        :return: A df with the cropland area per district over all rasters.
         '''
-        df = pd.DataFrame()
-
-        for raster in RASTER_NAMES:
-            df_of_raster = self.get_stats(raster)
-            df = df.append(df_of_raster)
+        gdf_districts = self.get_districts()
+        # The rasters are processed in parallel and the results merged in the order of RASTER_NAMES
+        stats = tiles_district_counts(self.path_in, {raster: self.raster_path(raster) for raster in RASTER_NAMES},
+                                      {raster: cropland_value(raster) for raster in RASTER_NAMES})
+        counts = pd.concat([self.get_stats(raster, gdf_districts, stats[raster]) for raster in RASTER_NAMES],
+                           ignore_index=True)
 
-        return df
+        return self.calc_croplands_area(counts)
 
     def load_extracted_crops(self):
         '''
         Loads all intermediate files (csv) on zonal statistics per raster.
-        :return: A concatenated df of all zonal statistics.
+        :return: A df with the cropland area per district over all rasters.
         '''
 
         path_in = self.path_in
 
-        all_files = s3_glob(path_in, 'cropland', 'cropland/crops_')
+        all_files = [f for f in s3_glob(path_in, 'cropland', 'cropland/crops_') if 'crops_locust' not in f]
         print(all_files)
 
-        df_from_each_file = (pd.read_csv(f, sep = "|") for f in all_files)
-        concatenated_df = pd.concat(df_from_each_file, ignore_index=True)
-        return concatenated_df
+        df_from_each_file = read_objects(all_files, lambda f: pd.read_csv(f, sep = "|"))
+        # Files written before the pixel counts were kept already hold the cropland area of their raster
+        counts = [df for df in df_from_each_file if 'croplands_count' in df.columns]
+        areas = [df[['GID_2', 'croplands_area']] for df in df_from_each_file if 'croplands_count' not in df.columns]
+        if areas:
+            print("... " + str(len(areas)) + " files in the former layout, their cropland areas are kept as they are.")
+        if counts:
+            areas.append(self.calc_croplands_area(pd.concat(counts, ignore_index=True)))
+        return pd.concat(areas, ignore_index=True)
 
     def add_fact_ids(self):
         '''
@@ -149,7 +159,7 @@ class Cropland:
         :return: The Cropland table in a parquet format with the date added in the name.
         '''
         crops_df = self.add_fact_ids()
-        self.flats.export_to_parquet(crops_df, filename)
+        self.flats.export_fact_table(crops_df, filename)
         #self.flats.export_csv_w_date(crops_df, filename) #only for testing purposes
         
 if __name__ == '__main__':
@@ -13,17 +13,22 @@ Created on Wed Jul 15 11:29:40 2020
 import pandas as pd
 import geopandas as gpd
 import geopandas
-from datetime import datetime
-from rasterstats import zonal_stats
-from utils.flat_files import FlatFiles
+from utils.zonal import tile_counts, tiles_counts, merge_tiles, cropland_value
+from utils.flat_files import FlatFiles, date_key
+from utils.locust_buffers import monthly_buffers, incremental_setting
+from utils.intersection import intersect_polygons
+from utils.boundaries import get_boundaries, cache_key as boundaries_key
+from utils.geocache import cached_gdf, hash_key, shapefile_tags
+from utils.projection import EQUAL_AREA_CRS, UTM_CRS, area_km2
 from utils.s3_glob import s3_glob
+from utils.s3_list import clear_listings
+from utils.s3_fetch import read_objects
 import glob
 import warnings
 import yaml
 warnings.filterwarnings("ignore")
-import boto3
-client = boto3.client('s3')
 import os
+import time
 
 RASTER_NAMES = ["N00E30", "S10E40", "S10E30", "S10E20", "N10E50", "N10E40", "N10E30", "N00E50", "N00E40", "N00E20", "N20E30", "N20E20", "N10E20"] #if project extended to more countries, their corresponding geotiffs refering to croplands could be added here in the list
 #RASTER_NAMES = ["S10E30", "S10E20", "N10E50", "N10E40", "N10E30", "N00E50", "N00E40", "N00E20", "N20E30", "N20E20", "N10E20"]
@@ -37,26 +42,17 @@ class CroplandLocust:
         self.path_out = path_out
         self.flats = FlatFiles(self.path_in, self.path_out)
 
-        # Import districts
-        self.shp2_Kenya = gpd.read_file(self.path_in + "/Spatial/gadm36_KEN_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Somalia = gpd.read_file(self.path_in + "/Spatial/gadm36_SOM_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Ethiopia = gpd.read_file(self.path_in + "/Spatial/gadm36_ETH_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Uganda = gpd.read_file(self.path_in + "/Spatial/gadm36_UGA_2.shp")[['GID_2', 'geometry']]
-        self.shp2_Sudan = gpd.read_file(self.path_in + "/Spatial/gadm36_SDN_2.shp")[['GID_2', 'geometry']]
-        self.shp2_SSudan = gpd.read_file(self.path_in + "/Spatial/gadm36_SSD_2.shp")[['GID_2', 'geometry']]
-
-        # Import locust gdf
-        self.locust_gdf = gpd.read_file(self.path_in + "/swarm/Swarm_Master.shp")
+        # Locust shp, only read if the affected areas are not cached
+        self.locust_path = self.path_in + "/swarm/Swarm_Master.shp"
+        self.locust_distr = None
 
     def get_districts(self):
         '''
 
         :return: A geodataframe with all districts of the 4 countries concatenated.
         '''
-        district_level = [self.shp2_Kenya, self.shp2_Ethiopia, self.shp2_Somalia, self.shp2_Uganda, self.shp2_Sudan,
-                          self.shp2_SSudan]
-        gdf_districts = gpd.GeoDataFrame(pd.concat(district_level, ignore_index=True))
-        gdf_districts.crs = {"init": "epsg:4326"}
+        gdf_districts = get_boundaries(self.path_in, 2)[['locationID', 'geometry']]
+        gdf_districts = gdf_districts.rename(columns={'locationID': 'GID_2'})
         return gdf_districts
 
     def filter_data(self):
@@ -65,7 +61,7 @@ class CroplandLocust:
         :return: A gdf filtered by countries, dates and columns.
         '''
 
-        locust_gdf = self.locust_gdf
+        locust_gdf = gpd.read_file(self.locust_path)
         # Filter dates
         locust_gdf['STARTDATE'] = pd.to_datetime(locust_gdf['STARTDATE'], format='%Y-%m-%d')
         locust_gdf_filtered = locust_gdf[(locust_gdf['STARTDATE'] > pd.Timestamp(2000, 1, 1)) & (locust_gdf['STARTDATE'] < pd.Timestamp.today())]
@@ -79,72 +75,28 @@ class CroplandLocust:
 
         return locust_gdf_filtered
 
-    def calc_buffer(self):
-        '''
-
-        :return: A gdf with locust buffers of 25km reprojected and calculated in degrees.
+    def buffers_path(self):
         '''
-        locust_gdf_filtered = self.filter_data()
-        # Reproject to calculate in meters
-        cpr_gdf = locust_gdf_filtered.to_crs({'init': 'epsg:32636'})
-        buffer_length_in_meters = (25 * 1000) # buffer: 25km
-        cpr_gdf['geometry'] = cpr_gdf.geometry.buffer(buffer_length_in_meters)
-        cpr_gdf['area_m'] = cpr_gdf.geometry.area
-
-        # Change again system to calculate in degrees
-        cpr_gdf = cpr_gdf.to_crs({'init': 'epsg:4326'})
-        cpr_gdf['area_d'] = cpr_gdf.geometry.area
-        cpr_gdf.head(3)
-
-        return cpr_gdf
 
-    def groupby_month(self):
+        :return: The path of the stored monthly buffers in incremental mode, None otherwise.
         '''
-
-        :return: A gdf grouped by month and year.
-        '''
-
-        locust_grouped = self.calc_buffer()
-        locust_grouped.index = pd.to_datetime(locust_grouped['STARTDATE'], format='%Y-%m-%d')
-        locust_grouped = locust_grouped[['OBJECTID', 'geometry']]
-        locust_grouped = locust_grouped.groupby(by=[locust_grouped.index.month, locust_grouped.index.year])
-        return locust_grouped
+        if incremental_setting():
+            return self.path_out + '/locust_buffers/cropland_locust_buffers.parquet'
+        return None
 
     def overlapping_buffers(self):
         '''
-        Unions the overlapping buffers grouped by month and year.
-        :return: A df with the final buffer geometries and dates
+        Unions the overlapping 25km buffers of the swarms grouped by month and year.
+        :return: A gdf with the final buffer geometries and dates
         '''
-        locust_grouped = self.groupby_month()
-
-        # Initialise empty df
-        locust_buffers = pd.DataFrame()
-
-        #Iterate over groups
-        for group_name, df_group in locust_grouped:
-            # Union of overlapping buffers
-            geoms = df_group.geometry.unary_union
-            df_group = geopandas.GeoDataFrame(geometry=[geoms])
-            df_group = df_group.explode().reset_index(drop=True)
-
-            # add date column
-            df_group['date'] = '01-' + str(group_name[0]) + '-' + str(group_name[1])
-            df_group['date'] = pd.to_datetime(df_group['date'], format='%d-%m-%Y')
-
-            # append to dataframe
-            locust_buffers = locust_buffers.append(df_group)
-
-        return locust_buffers
+        return monthly_buffers(self.filter_data(), self.buffers_path())
 
     def loc_buffers_to_gdf(self):
         '''
-        Transforms df to gdf.
+        Selects the columns of the buffers.
         :return: A gdf of the locust final buffers.
         '''
-        locust_buffer = self.overlapping_buffers()
-        crs = {'init': 'epsg:4326'}
-        geometry = locust_buffer['geometry']
-        locust_buffers_gdf = gpd.GeoDataFrame(locust_buffer, crs=crs, geometry=geometry)
+        locust_buffers_gdf = self.overlapping_buffers()[['date', 'geometry']]
         return locust_buffers_gdf
 
     def intersect(self):
@@ -157,89 +109,131 @@ class CroplandLocust:
         #crops_v = self.filter_crops()
 
         # intersect with districts
-        locust_distr = gpd.overlay(locust_buffers_gdf, gdf_districts, how='intersection')
+        locust_distr = intersect_polygons(locust_buffers_gdf, gdf_districts)
         ## intersect with cropland
         #crops_locust_district = gpd.overlay(crops_v, locust_distr, how='intersection')
 
         return locust_distr
 
-    def area_districts_affected_locust(self):
+    def calc_area_districts_affected_locust(self):
         '''
         Calculates the area affected by locusts per district.
-        :return: A gdf including the area in degrees.
+        :return: A gdf including the area in km².
         '''
-        locust_district = self.intersect()
-        locust_district['area'] = locust_district.geometry.area
+        locust_district = self.intersect().reset_index(drop=True)
+        locust_district['area'] = area_km2(locust_district)
 
         return locust_district
 
-    def get_stats(self, raster):
+    def locust_cache_key(self):
         '''
-        Calculates the croplands affected by locust per district, using the method count of zonal_stats.
-        :param raster: The geotiff indicating the cropland area
-        :return: A df with two columns, district id and cropland area.
+
+        :return: A hash of the versions of the swarms shp and of the districts, and of today's date as filter_data
+        drops the swarms reported after today.
         '''
+        tags = shapefile_tags(self.locust_path)
+        tags.append(boundaries_key(self.path_in, 2))
+        tags.append(time.strftime("%Y%m%d"))
+        tags.append(EQUAL_AREA_CRS)
+        tags.append(UTM_CRS)
+        return hash_key(tags)
 
-        raster_path = self.path_in + "/cropland/GFSAD30AFCE_2015_" + raster + "_001_2017261090100.tif"
-        locust_distr = self.area_districts_affected_locust()
+    def area_districts_affected_locust(self):
+        '''
+        Returns the area affected by locusts per district, calculated once per run and shared by all rasters. It is also
+        stored next to the locust buffers in the reporting bucket, so a rerun after a failed raster, on a new instance,
+        does not calculate the buffers and intersections again.
+        :return: A gdf including the area in km².
+        '''
+        if self.locust_distr is None:
+            self.locust_distr = cached_gdf('locust', 'crops_locust_distr', self.locust_cache_key(),
+                                           self.calc_area_districts_affected_locust,
+                                           store_dir=self.path_out + '/locust_buffers')
+        return self.locust_distr
 
-        stats = zonal_stats(locust_distr.geometry, raster_path, stats="count", categorical=True)
-
-        if raster == "N00E50":
-            try:
-                locust_distr['croplands_count'] = pd.DataFrame.from_dict(stats)[1]
-            except:
-                print("Raster " + raster + " does not contain any croplands impacted by locust for the selected districts and dates.")
-                return
-        elif raster in RASTER_NAMES:
-            try:
-                locust_distr['croplands_count'] = pd.DataFrame.from_dict(stats)[2]
-            except:
-                print("Raster " + raster + " does not contain any croplands impacted by locust for the selected districts and dates.")
-                return
-        else:
+    def raster_path(self, raster):
+        '''
+
+        :param raster: The name of the geotiff tile.
+        :return: The path of the geotiff indicating the cropland area.
+        '''
+        return self.path_in + "/cropland/GFSAD30AFCE_2015_" + raster + "_001_2017261090100.tif"
+
+    def get_stats(self, raster, locust_distr=None, stats=None):
+        '''
+        Counts the cropland pixels of the locust affected areas per district that intersect the raster.
+        :param raster: The geotiff indicating the cropland area
+        :param locust_distr: The locust affected areas per district, calculated if not given.
+        :param stats: The pixel counts of the raster if already calculated, see utils.zonal.tiles_counts.
+        :return: A df with the affected area id, district id, date, area and the cropland and total pixel counts.
+        '''
+        if raster not in RASTER_NAMES:
             print("Raster not in RASTER_NAMES.")
             return
+        if locust_distr is None:
+            locust_distr = self.area_districts_affected_locust()
+
+        if stats is None:
+            stats = tile_counts(locust_distr, raster, self.raster_path(raster), cropland_value(raster))
+
+        crops_locust_district = locust_distr.loc[stats.index, ['GID_2', 'date', 'area']]
+        crops_locust_district.insert(0, 'areaID', stats.index)
+        crops_locust_district['croplands_count'] = stats['category_count']
+        crops_locust_district['area_count'] = stats['area_count']
 
-        # Calculating the area affected by locust per district
-        locust_distr['area_count'] = pd.DataFrame.from_dict(stats)["count"]
-        locust_distr = locust_distr[locust_distr['croplands_count'].notnull()]
-        locust_distr['crops_locust_area'] = locust_distr['croplands_count'] * locust_distr['area'] / locust_distr[
-            'area_count']
-        #print(locust_distr.columns)
-        crops_locust_district = locust_distr[['GID_2', 'crops_locust_area', 'date']]
         file_name = "/cropland/crops_locust_distr_" + raster
         crops_locust_district.to_csv(self.path_in + file_name + '.csv', sep='|', encoding='utf-8', index=False)
+        clear_listings(self.path_in + file_name + '.csv')
         print(raster + " exported.")
         return crops_locust_district
 
+    def calc_crops_locust_area(self, counts):
+        '''
+        Adds up the pixel counts of the affected areas split between rasters and calculates their cropland area.
+        :param counts: A df with the pixel counts per affected area and raster.
+        :return: A df with three columns, district id, cropland area affected by locust and date.
+        '''
+        crops_locust_district = merge_tiles(counts, ['areaID', 'GID_2', 'date', 'area'])
+        crops_locust_district = crops_locust_district[crops_locust_district['croplands_count'].notnull()]
+        crops_locust_district['crops_locust_area'] = crops_locust_district['croplands_count'] * crops_locust_district[
+            'area'] / crops_locust_district['area_count']
+
+        return crops_locust_district[['GID_2', 'crops_locust_area', 'date']]
+
     def extract_crops_locust(self):
         '''
         Function to run all zonal statistics for all rasters by calling get_stats.
-        :return: An appended df of all zonal statistics.
+        :return: A df with the cropland area affected by locust per district and date over all rasters.
         '''
-        df = pd.DataFrame()
-
-        for raster in RASTER_NAMES:
-            print(raster + " raster being processed.")
-            df_of_raster = self.get_stats(raster)
-            df = df.append(df_of_raster)
+        locust_distr = self.area_districts_affected_locust()
+        # The rasters are processed in parallel and the results merged in the order of RASTER_NAMES
+        stats = tiles_counts(locust_distr, {raster: self.raster_path(raster) for raster in RASTER_NAMES},
+                             {raster: cropland_value(raster) for raster in RASTER_NAMES})
+        counts = pd.concat([self.get_stats(raster, locust_distr, stats[raster]) for raster in RASTER_NAMES],
+                           ignore_index=True)
 
-        return df
+        return self.calc_crops_locust_area(counts)
 
     def load_extracted_crops(self):
         '''
         Loads all intermediate files (csvs) on zonal statistics per raster.
-        :return: A concatenated df of all zonal statistics.
+        :return: A df with the cropland area affected by locust per district and date over all rasters.
         '''
        
         all_files = s3_glob(self.path_in, 'cropland', 'cropland/crops_locust_distr')
 
         print(all_files)
         
-        df_from_each_file = (pd.read_csv(f, sep = "|") for f in all_files)
-        concatenated_df = pd.concat(df_from_each_file, ignore_index=True)
-        return concatenated_df
+        df_from_each_file = read_objects(all_files, lambda f: pd.read_csv(f, sep = "|"))
+        # Files written before the pixel counts were kept already hold the affected cropland area of their raster
+        counts = [df for df in df_from_each_file if 'croplands_count' in df.columns]
+        areas = [df[['GID_2', 'crops_locust_area', 'date']] for df in df_from_each_file
+                 if 'croplands_count' not in df.columns]
+        if areas:
+            print("... " + str(len(areas)) + " files in the former layout, their affected areas are kept as they are.")
+        if counts:
+            areas.append(self.calc_crops_locust_area(pd.concat(counts, ignore_index=True)))
+        return pd.concat(areas, ignore_index=True)
 
     def add_fact_ids(self):
         '''
@@ -251,11 +245,8 @@ class CroplandLocust:
         crops_locust_district['factID'] = 'CROP_LOC_DIS' + crops_locust_district.index.astype(str)
         crops_locust_district['locationID'] = crops_locust_district['GID_2']
         crops_locust_district['value'] = crops_locust_district['crops_locust_area']
-        #crops_locust_district['date'] = pd.to_datetime(crops_locust_district['date'], format = '%Y-%m-%d')
-
-        crops_locust_district['date'] = crops_locust_district['date'].apply(lambda x: datetime.strptime(x, '%Y-%m-%d'))
-        crops_locust_district['dateID'] = crops_locust_district['date'].apply(lambda x: datetime.strftime(x, '%Y%m%d'))
-        crops_locust_district['dateID'] = crops_locust_district['dateID'].astype(int) #Athena accepts a bigint to prepare the view
+        crops_locust_district['date'] = pd.to_datetime(crops_locust_district['date'], format = '%Y-%m-%d')
+        crops_locust_district['dateID'] = date_key(crops_locust_district['date']) #Athena accepts a bigint to prepare the view
         #print(crops_locust_district[['date', 'dateID']].head())
 
         # Select fact table columns
@@ -269,7 +260,7 @@ class CroplandLocust:
         :return: The Cropland table in both a parquet and csv format with the date added in the name.
         '''
         crops_loc_df = self.add_fact_ids()
-        self.flats.export_to_parquet(crops_loc_df, filename)
+        self.flats.export_fact_table(crops_loc_df, filename)
 
 if __name__ == '__main__':
 
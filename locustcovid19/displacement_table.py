@@ -12,7 +12,8 @@ Latest update on Wed Sep 23 11:30:40 2020
 import os
 import yaml
 import pandas as pd
-from utils.flat_files import FlatFiles
+from utils.flat_files import FlatFiles, ymd_key
+from utils.staging import read_csv_staged
 
 COUNTRIES = ["Kenya", "Somalia", "Ethiopia", "Uganda", "South Sudan", "Sudan"]
 
@@ -23,7 +24,7 @@ class DisplacementTable:
     def __init__(self, path_in, path_out):
         self.path_in = path_in
         self.path_out = path_out
-        self.displacement_df = pd.read_csv(self.path_in + "/social_cohesion/displacement/displacements.csv", skiprows=4, sep=",", encoding='utf-8')
+        self.displacement_df = read_csv_staged(self.path_in + "/social_cohesion/displacement/displacements.csv", skiprows=4, sep=",", encoding='utf-8')
         self.flats = FlatFiles(self.path_in, self.path_out)
 
     def filter_years(self, df):
@@ -75,8 +76,7 @@ class DisplacementTable:
         displacements['factID'] = 'DISP_' + displacements.index.astype(str)
 
         # Add dateID
-        displacements['dateID'] = displacements['year'].astype(str) + '0101'
-        displacements['dateID'] = displacements['dateID'].astype(int)
+        displacements['dateID'] = ymd_key(displacements['year'])
         #displacements = self.flats.add_date_id(displacements, 'year')
 
         # Add locationID
@@ -91,7 +91,7 @@ class DisplacementTable:
         Exports to parquet format.
         '''
         displacement_df = self.add_ids_to_table()
-        self.flats.export_to_parquet(displacement_df, '/displacement_fact/displacement_table')
+        self.flats.export_fact_table(displacement_df, '/displacement_fact/displacement_table')
 
 if __name__ == '__main__':
 
@@ -11,13 +11,16 @@ Created on Thu Sep 03 12:56:40 2020
 import pandas as pd
 import geopandas as gpd
 from utils.flat_files import FlatFiles
+from utils.intersection import intersect_polygons
+from utils.boundaries import get_boundaries
+from utils.s3_glob import s3_glob
+from utils.s3_fetch import read_shapefiles
 import glob
 import yaml
 import os
-from boto3 import client
-client = client('s3')
+import re
 
-COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
+FAMINE_SHAPEFILES = re.compile(r'famine/EA_[^/]*\.shp$')
 
 class FamineTable:
     '''
@@ -38,62 +41,24 @@ class FamineTable:
 #        path_in = 's3://mercy-locust-covid19-landing-test'
         path_in = str(self.path_in)
 
-        resp = client.list_objects_v2(Bucket=path_in[5:], Prefix='famine')
-#        resp = client.list_objects_v2(Bucket='mercy-locust-covid19-landing')
-        keys = []
-        all_files = []
-        for obj in resp['Contents']:
-            keys.append(obj['Key'])
-        for i in keys:
-            if 'famine/EA_' in i:
-              if '.shp' in i and '.shp.xml' not in i:
-                 s = path_in + '/' + str(i)
-                 all_files.append(s)
+        all_files = s3_glob(path_in, 'famine', FAMINE_SHAPEFILES)
 
         print(all_files)
 
 #        all_files0 = [for f in all_files1]
 
-        for file in all_files:
+        # The shapefiles are downloaded and read concurrently
+        for file, gdf in zip(all_files, read_shapefiles(all_files, gpd.read_file)):
             # Split by "_"
-            print("... Reading file: " + file)
+            print("... Read file: " + file)
             date, file_type = file.split('.')[0].split('_')[1:]
 #            print('first line')
-            gdf = (gpd.read_file(file)
-                  .assign(date=date+'01'))
-            gdf_list.append(gdf)
+            gdf_list.append(gdf.assign(date=date+'01'))
 
         famine = pd.concat(gdf_list)
 
         return famine
 
-    def read_boundaries_shp(self, country, hierarchy):
-        '''
-
-        :param country: The reference country
-        :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
-        :return: A geodataframe with 2 columns: locationID and geometry.
-        '''
-        gdf_country = gpd.read_file(self.path_in + "/Spatial/gadm36_" + country + "_" + str(hierarchy) + ".shp")
-        GID_column = 'GID_' + str(hierarchy)
-        gdf_country = gdf_country[[GID_column, 'geometry']]
-        gdf_country = gdf_country.rename(columns={GID_column: 'locationID'})
-
-        return gdf_country
-
-    def get_districts(self):
-        '''
-        Reads and appends all gdfs per country at a district level.
-        :return: A gdf of all districts of the countries encountered in COUNTRIES_IDS.
-        '''
-        all_districts = gpd.GeoDataFrame()
-        for country in COUNTRIES_IDS:
-            gdf_district = self.read_boundaries_shp(country, 2)
-            all_districts = all_districts.append(gdf_district)
-        all_districts.crs = {"init": "epsg:4326"}
-
-        return all_districts
-
     def rename_columns(self, gdf):
         '''
 
@@ -111,10 +76,10 @@ class FamineTable:
         '''
         famine = self.rename_columns(self.read_famine_data())
 
-        gdf_districts = self.get_districts()
+        gdf_districts = get_boundaries(self.path_in, 2)[['locationID', 'geometry']]
         #gdf_districts.to_crs(famine)
         print("... Intersecting IPC indicator with districts.")
-        famine_district = gpd.overlay(famine, gdf_districts, how='intersection')
+        famine_district = intersect_polygons(famine, gdf_districts)
         return famine_district
 
     def add_ids(self):
@@ -146,7 +111,7 @@ class FamineTable:
         '''
         famine_df = self.add_ids()
         #self.flats.export_csv_w_date(famine_df, 'famine_table')
-        self.flats.export_to_parquet(famine_df, '/famine_fact/famine_table')
+        self.flats.export_fact_table(famine_df, '/famine_fact/famine_table')
 
 
 if __name__ == '__main__':
@@ -18,6 +18,7 @@ import os
 import pandas as pd
 import numpy as np
 from utils.flat_files import FlatFiles
+from utils.staging import read_csv_staged
 import yaml
 
 class FinancialInclusion:
@@ -27,7 +28,7 @@ class FinancialInclusion:
     def __init__(self, path_in, path_out):
         self.path_in = path_in
         self.path_out = path_out
-        df = pd.read_csv(self.path_in + '/social_cohesion/financial_inclusion/FINDEX_Data.csv')
+        df = read_csv_staged(self.path_in + '/social_cohesion/financial_inclusion/FINDEX_Data.csv')
         self.fin_inclusion_df = df.iloc[:-5]
         self.flats = FlatFiles(self.path_in, self.path_out)
 
@@ -122,7 +123,7 @@ class FinancialInclusion:
         Exports to parquet format.
         '''
         inclusion_df = self.add_ids_to_table()
-        self.flats.export_to_parquet(inclusion_df, '/financial_inclusion_fact/financial_inclusion_table')
+        self.flats.export_fact_table(inclusion_df, '/financial_inclusion_fact/financial_inclusion_table')
 
 if __name__ == '__main__':
 
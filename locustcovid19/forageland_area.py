@@ -14,8 +14,9 @@ import os
 import pandas as pd
 import geopandas as gpd
 from utils.flat_files import FlatFiles
+from utils.boundaries import get_boundaries, boundary_areas
 import yaml
-from rasterstats import zonal_stats
+from utils.zone_index import district_zones, zonal_categorical_counts
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -27,8 +28,6 @@ warnings.filterwarnings("ignore")
 #INPUT_PATH = r'data/input/'
 #OUTPUT_PATH = r'data/output/'
 
-COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
-
 class Forageland:
     '''
     This class calculates the forageland area per district.
@@ -45,43 +44,18 @@ class Forageland:
         # Forageland 2003 raster path
         self.raster_path = self.path_in + '/forageland/forageland2003.tif'
 
-    def read_boundaries_shp(self, country, hierarchy):
-        '''
-
-        :param country: The reference country
-        :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
-        :return: A geodataframe with 2 columns: locationID and geometry.
-        '''
-        gdf_country = gpd.read_file(self.path_in + "/Spatial/gadm36_" + country + "_" + str(hierarchy) + ".shp")
-        GID_column = 'GID_' + str(hierarchy)
-        gdf_country = gdf_country[[GID_column, 'geometry']]
-        gdf_country = gdf_country.rename(columns={GID_column: 'locationID'})
-
-        return gdf_country
-
-    def get_districts(self):
-        '''
-
-        :return: A geodataframe with all districts of the 4 countries concatenated.
-        '''
-        gdf_districts = gpd.GeoDataFrame()
-        for country in COUNTRIES_IDS:
-            gdf_district = self.read_boundaries_shp(country, 2)
-            gdf_districts = gdf_districts.append(gdf_district)
-        gdf_districts.crs = {"init": "epsg:4326"}
-        return gdf_districts
-
     def get_stats(self):
         '''
 
         :param raster: The geotiff indicating the cropland area
         :return: A df with two columns, district id and cropland area.
         '''
-        gdf_districts = self.get_districts()
-        gdf_districts['area'] = gdf_districts.geometry.area # Calculate area of each district.
-        stats = zonal_stats(gdf_districts.geometry, self.raster_path,  layer="polygons", stats="count", categorical=True) # Cross districts with foragelands
-        gdf_districts['forageland_count'] = pd.DataFrame.from_dict(stats)[1] # Count areas of values == 1, foragelands, per district
-        gdf_districts['area_count'] = pd.DataFrame.from_dict(stats)["count"] # Total number of pixels per district
+        gdf_districts = get_boundaries(self.path_in, 2).copy()
+        gdf_districts['area'] = boundary_areas(self.path_in, 2) # Area of each district in km².
+        zones = district_zones(self.path_in, self.raster_path)
+        stats = zonal_categorical_counts(zones, self.raster_path, len(gdf_districts), [1]) # Cross districts with foragelands
+        gdf_districts['forageland_count'] = stats[1] # Count areas of values == 1, foragelands, per district
+        gdf_districts['area_count'] = stats["count"] # Total number of pixels per district
         gdf_districts = gdf_districts[gdf_districts['forageland_count'].notnull()] # drop nulls
         gdf_districts['forageland_area'] = gdf_districts['forageland_count'] * gdf_districts['area'] / gdf_districts[
             'area_count']
@@ -17,12 +17,15 @@ import geopandas as gpd
 import geopandas
 import yaml
 from utils.flat_files import FlatFiles
+from utils.date_dim import date_dim
+from utils.locust_buffers import monthly_buffers, incremental_setting
+from utils.intersection import intersect_polygons
+from utils.boundaries import get_boundaries, boundary_areas
+from utils.projection import area_km2
 from rasterstats import zonal_stats
 import warnings
 warnings.filterwarnings("ignore")
 
-COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
-
 class ForagelandLocust:
     '''
     This class calculates the forageland area affected by locust per district.
@@ -30,8 +33,7 @@ class ForagelandLocust:
     def __init__(self, path_in, path_out):
         self.path_in = path_in
         self.path_out = path_out
-        self.dates = pd.read_csv(self.path_out + '/Date_Dim/Date_Dim.csv', sep=",")
-        self.dates['date'] = pd.to_datetime(self.dates['date'], format = '%m/%d/%Y')
+        self.dates = date_dim()
         self.flats = FlatFiles(path_in, path_out)
 
         # # Import forageland vector
@@ -45,32 +47,6 @@ class ForagelandLocust:
         self.locust_gdf = gpd.read_file(self.path_in + "/swarm/Swarm_Master.shp")
         #print(self.locust_gdf.COUNTRYID.unique()) # to select new countries
 
-    def read_boundaries_shp(self, country, hierarchy):
-        '''
-
-        :param country: The reference country
-        :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
-        :return: A geodataframe with 2 columns: locationID and geometry.
-        '''
-        gdf_country = gpd.read_file(self.path_in + "/Spatial/gadm36_" + country + "_" + str(hierarchy) + ".shp")
-        GID_column = 'GID_' + str(hierarchy)
-        gdf_country = gdf_country[[GID_column, 'geometry']]
-        gdf_country = gdf_country.rename(columns={GID_column: 'locationID'})
-
-        return gdf_country
-
-    def get_districts(self):
-        '''
-
-        :return: A geodataframe with all districts of the 4 countries concatenated.
-        '''
-        gdf_districts = gpd.GeoDataFrame()
-        for country in COUNTRIES_IDS:
-            gdf_district = self.read_boundaries_shp(country, 2)
-            gdf_districts = gdf_districts.append(gdf_district)
-        gdf_districts.crs = {"init": "epsg:4326"}
-        return gdf_districts
-
     def filter_data(self):
         '''
 
@@ -93,72 +69,28 @@ class ForagelandLocust:
 
         return locust_gdf_filtered
 
-    def calc_buffer(self):
-        '''
-
-        :return: A gdf with locust buffers of 25km reprojected and calculated in degrees.
-        '''
-        locust_gdf_filtered = self.filter_data()
-        # Reproject to calculate in meters
-        cpr_gdf = locust_gdf_filtered.to_crs({'init': 'epsg:32636'})
-        buffer_length_in_meters = (25 * 1000) # buffer: 25km
-        cpr_gdf['geometry'] = cpr_gdf.geometry.buffer(buffer_length_in_meters)
-        cpr_gdf['area_m'] = cpr_gdf.geometry.area
-
-        # Change again system to calculate in degrees
-        cpr_gdf = cpr_gdf.to_crs({'init': 'epsg:4326'})
-        cpr_gdf['area_d'] = cpr_gdf.geometry.area
-        cpr_gdf.head(3)
-
-        return cpr_gdf
-
-    def groupby_month(self):
+    def buffers_path(self):
         '''
 
-        :return: A gdf grouped by month and year
+        :return: The path of the stored monthly buffers in incremental mode, None otherwise.
         '''
-
-        locust_grouped = self.calc_buffer()
-        locust_grouped.index = pd.to_datetime(locust_grouped['STARTDATE'], format='%Y-%m-%d')
-        locust_grouped = locust_grouped[['OBJECTID', 'geometry']]
-        locust_grouped = locust_grouped.groupby(by=[locust_grouped.index.month, locust_grouped.index.year])
-        return locust_grouped
+        if incremental_setting():
+            return self.path_out + '/locust_buffers/forageland_locust_buffers.parquet'
+        return None
 
     def overlapping_buffers(self):
         '''
-        Unions the overlapping buffers grouped by month and year.
-        :return: A df with the final buffer geometries and dates
+        Unions the overlapping 25km buffers of the swarms grouped by month and year.
+        :return: A gdf with the final buffer geometries and dates
         '''
-        locust_grouped = self.groupby_month()
-
-        # Initialise empty df
-        locust_buffers = pd.DataFrame()
-
-        #Iterate over groups
-        for group_name, df_group in locust_grouped:
-            # Union of overlapping buffers
-            geoms = df_group.geometry.unary_union
-            df_group = gpd.GeoDataFrame(geometry=[geoms])
-            df_group = df_group.explode().reset_index(drop=True)
-
-            # add date column
-            df_group['date'] = str(group_name[1]) + '-' + str(group_name[0]) + '-01'
-            df_group['date'] = pd.to_datetime(df_group['date'], format='%Y-%m-%d')
-
-            # append to dataframe
-            locust_buffers = locust_buffers.append(df_group)
-
-        return locust_buffers
+        return monthly_buffers(self.filter_data(), self.buffers_path())
 
     def loc_buffers_to_gdf(self):
         '''
-        Transforms df to gdf.
+        Selects the columns of the buffers.
         :return: A gdf of the locust final buffers.
         '''
-        locust_buffer = self.overlapping_buffers()
-        crs = {'init': 'epsg:4326'}
-        geometry = locust_buffer['geometry']
-        locust_buffers_gdf = gpd.GeoDataFrame(locust_buffer, crs=crs, geometry=geometry)
+        locust_buffers_gdf = self.overlapping_buffers()[['date', 'geometry']]
         return locust_buffers_gdf
 
     def intersect(self):
@@ -166,12 +98,12 @@ class ForagelandLocust:
         Intersects the buffers with the districts.
         :return: A gdf with locust affected districts.
         '''
-        gdf_districts = self.get_districts()
-        gdf_districts['area_districts'] = gdf_districts.geometry.area
+        gdf_districts = get_boundaries(self.path_in, 2).copy()
+        gdf_districts['area_districts'] = boundary_areas(self.path_in, 2)
         locust_buffers_gdf = self.loc_buffers_to_gdf()
 
         # intersect with districts
-        locust_distr = gpd.overlay(locust_buffers_gdf, gdf_districts, how='intersection')
+        locust_distr = intersect_polygons(locust_buffers_gdf, gdf_districts)
         # intersect with forageland
         #forage_locust_district = gpd.overlay(self.forageland_v, locust_distr, how='intersection')
 
@@ -180,10 +112,10 @@ class ForagelandLocust:
     def area_districts_affected_locust(self):
         '''
         Calculates the area affected by locust
-        :return: A gdf including the area in degrees
+        :return: A gdf including the area in km²
         '''
         locust_district = self.intersect()
-        locust_district['area_locust'] = locust_district.geometry.area
+        locust_district['area_locust'] = area_km2(locust_district)
 
         return locust_district
 
@@ -242,7 +174,7 @@ class ForagelandLocust:
         :return: The Forageland table in both a parquet and csv format with the date added in the name.
         '''
         forageland_loc_df = self.add_fact_ids()
-        self.flats.export_to_parquet(forageland_loc_df, filename)
+        self.flats.export_fact_table(forageland_loc_df, filename)
         #self.flats.export_csv_w_date(forageland_loc_df, filename)
 
 if __name__ == '__main__':
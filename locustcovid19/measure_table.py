@@ -5,8 +5,10 @@ Created on Thu Jul 06 17:16:40 2020
 
 @author: linnea.evanson@accenture.com
 """
-import pandas as pd
+import os
+import yaml
 from utils.flat_files import FlatFiles
+from utils.staging import read_csv_staged
 
 class MeasuresTable:
     '''
@@ -16,16 +18,23 @@ class MeasuresTable:
     def __init__(self, path_in, path_out):
         self.path_in = path_in
         self.path_out = path_out
-        self.measures_df = pd.read_csv(path_in + 'measures_csv.csv', sep=";")
+        self.measures_df = read_csv_staged(path_in + '/measures_csv.csv', sep=";")
 
 
 if __name__ == '__main__':
 
+    filepath = os.path.join(os.path.dirname(__file__), 'config/application.yaml')
+    with open(filepath, "r") as ymlfile:
+        cfg = yaml.load(ymlfile, Loader=yaml.FullLoader)
+
+    INPUT_PATH = cfg['data']['landing']
+    OUTPUT_PATH = cfg['data']['reporting']
+
     print("------- Extracting measures table ---------")
 
-    measures_table = MeasuresTable()
+    measures_table = MeasuresTable(INPUT_PATH, OUTPUT_PATH)
 
     measures_df = measures_table.measures_df
 
     # Export
-    FlatFiles().export_to_parquet(measures_df, "measures")
+    FlatFiles(INPUT_PATH, OUTPUT_PATH).export_to_parquet(measures_df, "/measures")
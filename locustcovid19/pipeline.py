@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to run several modules in one run, in the order of their dependencies.
+Each module is registered with the modules whose outputs it reads, e.g. demand reads the population facts. The
+selected modules run as soon as the selected modules they depend on have finished. With one worker they run one after
+the other in this process, sharing the in-memory caches of the boundaries, the Date dimension and the s3 listings. With
+more workers, the independent ones run at the same time, each in its own child process, so that the module level
+caches and the process pools of utils.parallel are never shared between threads. A module is skipped if one of its
+dependencies failed. The table modules are imported inside the function running them, so a run only imports the
+libraries of the modules it executes. The modules and the number of workers are set in application.yaml:
+
+module: 'population,demand,price'
+pipeline:
+        workers: 2
+"""
+
+import sys
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+def run_date(input_path, output_path, cfg):
+    from utils.date_table import extend_date_dim, DATE_DIM_START, DATE_DIM_END
+    # Creation of the date dimension, only the dates not stored yet are added
+    print("------- Extending date dimension ---------")
+    dates_cfg = cfg.get('dates') or {}
+    extend_date_dim(output_path, dates_cfg.get('end', DATE_DIM_END), dates_cfg.get('start', DATE_DIM_START))
+
+def run_location(input_path, output_path, cfg):
+    from location_table import LocationTable
+    # Creation of location table
+    print("------- Extracting location table ---------")
+    LocationTable(input_path, output_path).export_to_parquet('location_table')
+
+def run_shapefile(input_path, output_path, cfg):
+    from shapefile_table import ShapefileTable
+    # Creation of shapefile table
+    print("------- Extracting shapefile table ---------")
+    shp_table = ShapefileTable(input_path, output_path)
+    gdf_all = shp_table.concat_sub_tables()
+    shp_table.export_to_shp(gdf_all, 'shapefile_table')     # Export table to shp
+
+def run_production(input_path, output_path, cfg):
+    from production_table import ProductionTable
+    # Creation of production table
+    print("------- Extracting production table ---------")
+    ProductionTable(input_path, output_path).export_files()
+
+def run_population(input_path, output_path, cfg):
+    from population_table import PopulationTable
+    # Creation of population table
+    print("------- Extracting population tables ---------")
+    years = (cfg.get('population') or {}).get('years', [2020])
+    print("Population {}:".format(years))
+    PopulationTable(years, input_path, output_path).export_population()
+
+def run_measure(input_path, output_path, cfg):
+    from measure_table import MeasuresTable
+    from utils.flat_files import FlatFiles
+    # Creation of measures table
+    print("------- Extracting measure table ---------")
+    measures_df = MeasuresTable(input_path, output_path).measures_df
+    FlatFiles(input_path, output_path).export_to_parquet(measures_df, "/measures")
+
+def run_demand(input_path, output_path, cfg):
+    from demand_table import DemandTable
+    # Creation of demand table
+    print("------- Extracting demand table ---------")
+    DemandTable(input_path, output_path).create_demand_table()
+
+def run_price(input_path, output_path, cfg):
+    from price_table import PricesTable
+    print("------- Extracting prices table ---------")
+    PricesTable(input_path, output_path).export_table('/price_fact/price_table')
+
+def run_cropland(input_path, output_path, cfg):
+    from cropland_area import Cropland
+    # Calculation of cropland
+    print("------- Extracting cropland area per district table ---------")
+    Cropland(input_path, output_path).export_table("/cropland_fact/cropland")
+
+def run_forageland(input_path, output_path, cfg):
+    from forageland_area import Forageland
+    # Calculation of forageland
+    print("------- Extracting forageland area per district table ---------")
+    Forageland(input_path, output_path).export_table("/forageland_fact/forageland")
+
+def run_foragelandlocust(input_path, output_path, cfg):
+    from forageland_locust import ForagelandLocust
+    # Calculation of forageland affected by locust
+    print("------- Extracting forageland area affected by locust per district table ---------")
+    ForagelandLocust(input_path, output_path).export_table('/forageland_locust_fact/forage_impact_locust_district')
+
+def run_croplandlocust(input_path, output_path, cfg):
+    from cropland_locust import CroplandLocust
+    # Calculation of cropland affected by locust
+    print("------- Extracting cropland area affected by locust per district table ---------")
+    CroplandLocust(input_path, output_path).export_table('/cropland_locust_fact/crops_impact_locust_district')
+
+def run_displacements(input_path, output_path, cfg):
+    from displacement_table import DisplacementTable
+    print("------- Extracting displacements table ---------")
+    DisplacementTable(input_path, output_path).export_files()
+
+def run_refugees(input_path, output_path, cfg):
+    from refugees_table import RefugeesTable
+    print("------- Extracting refugees table ---------")
+    RefugeesTable(input_path, output_path).export_files()
+
+def run_conflicts(input_path, output_path, cfg):
+    from conflicts_table import ConflictsTable
+    print("------- Extracting conflict events table ---------")
+    ConflictsTable(input_path, output_path).export_files()
+
+def run_violence(input_path, output_path, cfg):
+    from violence_table import ViolenceTable
+    print("------- Extracting violence against civilians table ---------")
+    ViolenceTable(input_path, output_path).export_files()
+
+def run_famine(input_path, output_path, cfg):
+    from famine_table import FamineTable
+    print("------- Extracting famine vulnerability table ---------")
+    FamineTable(input_path, output_path).export_files()
+
+def run_risk_locust(input_path, output_path, cfg):
+    from risk_indicators import RiskTables
+    print("------- Extracting locust risk table ---------")
+    RiskTables(input_path, output_path).export_files('locust')
+
+def run_risk_rvf(input_path, output_path, cfg):
+    from risk_indicators import RiskTables
+    print("------- Extracting RVF risk table ---------")
+    RiskTables(input_path, output_path).export_files('RVF')
+
+def run_vegetation(input_path, output_path, cfg):
+    from vegetation_index import VegetationTable
+    print("------- Extracting vegetation index per district table ---------")
+    VegetationTable(input_path, output_path).export_table()
+
+def run_vegetation_backfill(input_path, output_path, cfg):
+    from vegetation_index import backfill as backfill_vegetation
+    print("------- Extracting vegetation index per district tables of all missing periods ---------")
+    vegetation_cfg = cfg.get('vegetation') or {}
+    backfill_vegetation(input_path, output_path, vegetation_cfg.get('start'), vegetation_cfg.get('end'))
+
+def run_fin_inclusion(input_path, output_path, cfg):
+    from financial_inclusion import FinancialInclusion
+    print("------- Extracting financial inclusion table ---------")
+    FinancialInclusion(input_path, output_path).export_files()
+
+# Module name: (function, modules whose outputs it reads)
+MODULES = {'date': (run_date, []),
+           'location': (run_location, []),
+           'shapefile': (run_shapefile, []),
+           'production': (run_production, ['location']),
+           'population': (run_population, []),
+           'measure': (run_measure, []),
+           'demand': (run_demand, ['population']),
+           'price': (run_price, ['location']),
+           'cropland': (run_cropland, []),
+           'forageland': (run_forageland, []),
+           'foragelandlocust': (run_foragelandlocust, ['forageland']),
+           'croplandlocust': (run_croplandlocust, []),
+           'displacements': (run_displacements, []),
+           'refugees': (run_refugees, []),
+           'conflicts': (run_conflicts, []),
+           'violence': (run_violence, []),
+           'famine': (run_famine, []),
+           'risk.locust': (run_risk_locust, ['location']),
+           'risk.rvf': (run_risk_rvf, ['location']),
+           'vegetation': (run_vegetation, []),
+           'vegetation.backfill': (run_vegetation_backfill, ['vegetation']),
+           'fin_inclusion': (run_fin_inclusion, [])}
+
+def selected_modules(cfg):
+    '''
+
+    :param cfg: The configuration of application.yaml.
+    :return: The names of the modules to run: the module key, a single name or a comma separated list, or 'all'.
+    '''
+    module = cfg.get('module', '')
+    names = module if isinstance(module, list) else str(module).split(',')
+    names = [name.strip() for name in names if name.strip()]
+    if names == ['all']:
+        return list(MODULES)
+    return names
+
+def execution_order(names):
+    '''
+    Sorts the modules so that each one comes after the selected modules it depends on.
+    Dependencies that are not selected are not run, their outputs are read as they are.
+    :param names: The names of the modules.
+    :return: The names in topological order, keeping the given order between independent modules.
+    '''
+    unknown = [name for name in names if name not in MODULES]
+    if unknown:
+        raise ValueError('Invalid module: {}'.format(', '.join(unknown)))
+
+    ordered = []
+    def visit(name, path):
+        if name in ordered:
+            return
+        if name in path:
+            raise ValueError('Circular dependency: {}'.format(' -> '.join(path + [name])))
+        for dependency in MODULES[name][1]:
+            if dependency in names:
+                visit(dependency, path + [name])
+        ordered.append(name)
+
+    for name in names:
+        visit(name, [])
+    return ordered
+
+def run_module(name, input_path, output_path, cfg):
+    '''
+
+    :param name: The name of the module.
+    :return: True if the module finished, False if it raised an exception.
+    '''
+    try:
+        MODULES[name][0](input_path, output_path, cfg)
+        return True
+    except Exception as error:
+        print("... module " + name + " failed: " + repr(error))
+        traceback.print_exc()
+        return False
+
+def module_process(name, input_path, output_path, cfg):
+    '''
+    Target of the child process of a module, its exit code tells whether the module finished.
+    '''
+    sys.exit(0 if run_module(name, input_path, output_path, cfg) else 1)
+
+def run_modules(names, input_path, output_path, cfg, workers=1):
+    '''
+    Runs the modules, each one as soon as the selected modules it depends on have finished.
+    :param names: The names of the modules.
+    :param cfg: The configuration of application.yaml, passed to the modules.
+    :param workers: The number of modules run at the same time, each in its own process if more than 1.
+    :return: A dict with the name of each module as key and 'done', 'failed' or 'skipped' as value.
+    '''
+    pending = execution_order(names)
+    workers = max(int(workers), 1)
+    status = {}
+    running = {}
+
+    while pending or running:
+        for name in list(pending):
+            dependencies = [dependency for dependency in MODULES[name][1] if dependency in names]
+            if any(status.get(dependency) in ('failed', 'skipped') for dependency in dependencies):
+                print("... skipping " + name + ", a module it depends on did not finish")
+                status[name] = 'skipped'
+                pending.remove(name)
+            elif all(status.get(dependency) == 'done' for dependency in dependencies):
+                if workers == 1:
+                    status[name] = 'done' if run_module(name, input_path, output_path, cfg) else 'failed'
+                elif len(running) < workers:
+                    process = multiprocessing.Process(target=module_process, name=name,
+                                                      args=(name, input_path, output_path, cfg))
+                    process.start()
+                    running[process.sentinel] = (name, process)
+                else:
+                    continue
+                pending.remove(name)
+
+        if not running:
+            continue
+        for sentinel in wait(list(running)):
+            name, process = running.pop(sentinel)
+            process.join()
+            status[name] = 'done' if process.exitcode == 0 else 'failed'
+
+    return status
@@ -9,21 +9,54 @@ Created on Thu Jul 02 17:16:40 2020
 
 import pandas as pd
 import geopandas as gpd
-from rasterstats import zonal_stats
+from utils.zone_index import district_sums
+from utils.parallel import parallel_map
 from utils.flat_files import FlatFiles
+from utils.boundaries import get_boundaries
 import yaml
 import os
 
 COUNTRIES = ["KEN", "SOM", "ETH", "UGA", "SDN", "SSD"]
 
+def population_raster(path_in, country, year):
+    '''
+
+    :param country: The reference country
+    :param year: The year of the population raster.
+    :return: The path of the raster with the population density for the reference country and year.
+    '''
+    return path_in + "/population/" + country + "_pop_" + str(year) + ".tif"
+
+def country_population(job):
+    '''
+    Calculates the population per district of a country for several years, reading the districts and the zone index
+    once for all years. Runs in the worker processes.
+    :param job: A tuple with the landing path, the country and the list of years.
+    :return: A df with 3 columns: GID_2, year and population.
+    '''
+    path_in, country, years = job
+    print("Preparing {} population table for {}.".format(', '.join(str(year) for year in years), country))
+    gdf_districts = get_boundaries(path_in, 2)
+    in_country = (gdf_districts['GID_0'] == country).values
+
+    sums = district_sums(path_in, {year: population_raster(path_in, country, year) for year in years})[in_country]
+    sums.insert(0, 'GID_2', gdf_districts.loc[in_country, 'locationID'].values)
+    population = sums.melt(id_vars='GID_2', var_name='year', value_name='population')
+    population['year'] = population['year'].astype(int)
+    return population
+
 class PopulationTable:
     '''
-    This class creates the population table for the expected year.
+    This class creates the population table for the expected year, or for several years at once.
     '''
     def __init__(self, year, path_in, path_out):
+        '''
+
+        :param year: The year, or a list of years.
+        '''
         self.path_in = path_in
         self.path_out = path_out
-        self.year = year
+        self.years = list(year) if isinstance(year, (list, tuple)) else [year]
         self.flats = FlatFiles(path_in, path_out)
 
     def read_district_shp(self, country):
@@ -32,7 +65,9 @@ class PopulationTable:
         :param country: The reference country
         :return: A geodataframe with 2 columns: district id and geometry.
         '''
-        gdf_country = gpd.read_file(self.path_in + "/Spatial/gadm36_" + country + "_2.shp")[['GID_2', 'geometry']]
+        gdf_districts = get_boundaries(self.path_in, 2)
+        gdf_country = gdf_districts[gdf_districts['GID_0'] == country][['locationID', 'geometry']].reset_index(drop=True)
+        gdf_country = gdf_country.rename(columns={'locationID': 'GID_2'})
         return gdf_country
 
     def read_population_raster(self, country):
@@ -41,40 +76,32 @@ class PopulationTable:
         :param country: The reference country
         :return: The raster with the population density for the reference country.
         '''
-        raster_country = self.path_in + "/population/" + country + "_pop_" + str(self.year) + ".tif"
+        raster_country = population_raster(self.path_in, country, self.years[0])
         return raster_country
 
     def calc_population(self, country):
         '''
 
         :param country: The reference country
-        :return: The population for the given country
+        :return: The population per district of the given country for the first year, in the order of read_district_shp.
         '''
-        gdf_country = self.read_district_shp(country)
-        raster_country = self.read_population_raster(country)
-        pop_density_country = zonal_stats(gdf_country.geometry, raster_country, layer="polygons", stats='sum')
+        pop_density_country = country_population((self.path_in, country, self.years[:1]))['population']
         return pop_density_country
 
 
     def population_table(self):
         '''
 
-        :return: the geodataframe with the population column
+        :return: A df with the population per district and year, the countries processed in parallel.
         '''
-        countries_list = []
-        for country in COUNTRIES:
-            print("Preparing {} population table for {}.".format(self.year, country))
-            gdf_country = self.read_district_shp(country)
-            gdf_country['population'] = pd.DataFrame(self.calc_population(country))
-            countries_list.append(gdf_country)
-
-        population_gdf = gpd.GeoDataFrame(pd.concat(countries_list, ignore_index=True))
+        jobs = [(self.path_in, country, self.years) for country in COUNTRIES]
+        population_gdf = pd.concat(parallel_map(country_population, jobs), ignore_index=True)
         return population_gdf
 
     def add_ids_to_table(self):
         '''
 
-        :return: The population fact table
+        :return: The population fact table, partitioned by the year of its dateID when exported.
         '''
         population_gdf = self.population_table()
 
@@ -87,14 +114,11 @@ class PopulationTable:
         # Add measureID
         population_gdf['measureID'] = 26
 
-        # Add year, to be transformed to dateId in later step
-        population_gdf['year'] = self.year
-
         # Add factID
         population_gdf['factID'] = 'Pop_' + population_gdf['locationID'].astype(str) + "_" + population_gdf[
             'year'].astype(str)
 
-        # Add dateID
+        # Add dateID, the year column is transformed to a date
         population_gdf = self.flats.add_date_id(population_gdf, column = 'year')
 
         # Select fact table columns
@@ -105,37 +129,11 @@ class PopulationTable:
     def export_population(self):
         '''
 
-        :return: Exports population fact table to parquet format.
+        :return: Exports population fact table of all years to a parquet dataset partitioned by year,
+        population_fact/year=<year>/population_table.parquet.
         '''
         population_df = self.add_ids_to_table()
-        file_name = '/population_fact/population_table_' + str(self.year)
-        #file_name = '/population_table_' + str(self.year)
-        population_df.to_parquet(self.path_out + file_name + ".parquet", index=False)
-        print("Dataframe exported to parquet format")
-
-    def export_intermediate_pop(self):
-        population_df = self.add_ids_to_table()
-        filename = '/population_table_Sudan_' + str(self.year)
-        self.flats.export_to_csv(population_df, filename)
-        self.flats.export_to_parquet(population_df, filename)
-
-    def append_populations_year(self):
-        population_initial = pd.read_csv(self.path_out + '/population_table_' + str(self.year) + ".csv", sep="|")
-        population_Sudan= self.add_ids_to_table()
-        #population_Sudan= pd.read_csv(self.path_out + '/population_table_Sudan_' + str(self.year) + ".csv", sep="|")
-        population_total = population_initial.append(population_Sudan)
-        return population_total
-
-    def export_total_population(self):
-        '''
-
-        :return: Exports population fact table to parquet format.
-        '''
-        population_df = self.append_populations_year()
-        file_name = '/population_fact/population_table_' + str(self.year)
-        #file_name = '/population_table_all_countries_' + str(self.year)
-        population_df.to_parquet(self.path_out + file_name + ".parquet", index=False)
-        print("Dataframe exported to parquet format")
+        self.flats.export_fact_table(population_df, '/population_fact/population_table', partitions=['year'])
 
 if __name__ == '__main__':
 
@@ -149,5 +147,5 @@ if __name__ == '__main__':
     print('INPUT_PATH: ' + INPUT_PATH)
     print('OUTPUT_PATH: ' + OUTPUT_PATH)
 
-    for i in ['2020']:
-        PopulationTable(i, INPUT_PATH, OUTPUT_PATH).export_population()
+    years = (cfg.get('population') or {}).get('years', [2020])
+    PopulationTable(years, INPUT_PATH, OUTPUT_PATH).export_population()
@@ -20,15 +20,35 @@ import pickle
 import warnings
 warnings.filterwarnings("ignore")
 from datetime import datetime
-from utils.flat_files import FlatFiles
+from utils.flat_files import FlatFiles, ymd_key
+from utils.date_dim import date_dim
 from utils.s3_glob import s3_glob
+from utils.s3_fetch import thread_map
+from utils.staging import read_csv_staged, read_excel_staged
+from utils.csv_stream import read_csv_filtered
 COUNTRY_LIST = ['Uganda', 'Kenya', 'Somalia', 'Ethiopia', 'Sudan', 'South Sudan']
+# Columns of wfpvam_foodprices.csv that are not read
+DROPPED_PRICE_COLUMNS = ['adm0_id', 'adm1_id', 'mkt_id', 'cm_id', 'cur_id', 'cur_name', 'pt_id', 'um_id',
+                         'mp_commoditysource']
+RETAIL_COMMODITIES = ['Maize (white) - Retail', 'Maize - Retail', 'Rice - Retail', 'Rice (imported) - Retail',
+                      'Milk - Retail', 'Milk (fresh) - Retail', 'Milk (cow, fresh) - Retail',
+                      'Beans - Retail', 'Beans (dry) - Retail', 'Beans (fava, dry) - Retail', 'Meat (beef) - Retail',
+                      'Beans (red) - Retail']
 COUNTRIES_DICT = {'Uganda': 'UGA', 'Kenya': 'KEN', 'Somalia': 'SOM', 'Ethiopia': 'ETH', 'Sudan': 'SDN', 'South Sudan': 'SSD'}
 '''
 CURRENCIES_DICT = {'Ethiopia': {'ETB': 1, 'USD': 0.03}, 'Kenya': {'KES': 1, 'USD' : 0.0093}, 'Somalia': {'SOS':1, 'USD':0.0017},
                    'Uganda': {'UGX': 1, 'USD': 0.000271}, 'Sudan': {'SDG' : 1, 'USD' : 0.02}, 'South Sudan': {'SSD':1, 'USD':0.00768}}
 '''
 
+def price_rows(chunk):
+    '''
+
+    :param chunk: A chunk of the WFP prices.
+    :return: A boolean mask of the retail prices of the selected countries and commodities since 2000.
+    '''
+    return (chunk['adm0_name'].isin(COUNTRY_LIST) & (chunk['pt_name'] == 'Retail') & (chunk['mp_year'] >= 2000)
+            & chunk['cm_name'].isin(RETAIL_COMMODITIES))
+
 class PricesTable:
     '''
     This class extracts the markets of the prices and demand dfs.
@@ -37,36 +57,23 @@ class PricesTable:
         self.path_in = path_in
         self.path_out = path_out
         self.flats = FlatFiles(self.path_in, self.path_out)
-        self.dates = pd.read_csv(self.path_out + '/Date_Dim/Date_Dim.csv', sep=",")
-        self.dates['date'] = pd.to_datetime(self.dates['date'])
-        self.rates = pd.read_csv(self.path_in + '/price/currenciesconversion.csv', sep=';')
+        self.dates = date_dim()
+        self.rates = read_csv_staged(self.path_in + '/price/currenciesconversion.csv', sep=';')
         self.locations = pd.read_parquet(self.path_out + '/location_dim/location_table.parquet', engine='pyarrow')[['locationID', 'name', 'hierarchy', 'GID_0']]
 
         # prices
-        self.prices = pd.read_csv(self.path_in + '/price/wfpvam_foodprices.csv', sep=',')
+        # The global file is streamed in chunks, only the retail prices of the selected countries are kept
+        self.prices = read_csv_filtered(self.path_in + '/price/wfpvam_foodprices.csv', price_rows,
+                                        lambda column: column not in DROPPED_PRICE_COLUMNS, sep=',')
 
     def filter_prices(self):
         '''
         Filters prices table.
         :return: A df filtered per country, Retail, year & commodity.
         '''
-        #Load prices
+        #Load prices, already filtered per country, Retail, year & commodity and without the unused columns while
+        #reading, see price_rows
         prices = self.prices
-        #Filter countries
-        prices = prices[prices['adm0_name'].isin(COUNTRY_LIST)]
-        #Filter for retail only
-        prices = prices[prices.pt_name == 'Retail']
-        #Filter years
-        prices = prices[prices.mp_year >= 2000]
-        #Filter columns
-        prices = prices.drop(['adm0_id', 'adm1_id', 'mkt_id', 'cm_id', 'cur_id', 'cur_name', 'pt_id', 'um_id',
-                      'mp_commoditysource'], axis=1)
-        #Filter commodities
-        cm_name = ['Maize (white) - Retail', 'Maize - Retail', 'Rice - Retail', 'Rice (imported) - Retail',
-                   'Milk - Retail', 'Milk (fresh) - Retail', 'Milk (cow, fresh) - Retail',
-                   'Beans - Retail', 'Beans (dry) - Retail', 'Beans (fava, dry) - Retail', 'Meat (beef) - Retail',
-                   'Beans (red) - Retail']
-        prices = prices[prices['cm_name'].isin(cm_name)]
 
         #prices.to_csv('data/input/prices_filtered.csv', sep='|', encoding='utf-8', index=False)
 
@@ -244,10 +251,8 @@ class PricesTable:
         price_table['factID'] = 'PRICE_' + price_table.index.astype(str)
 
         # Create date & dateID column
-        price_table['date'] = price_table['mp_year'].astype(str) + '-' + price_table['mp_month'].astype(str) + '-01'
-        price_table['date'] = price_table['date'].apply(lambda x: datetime.strptime(x, '%Y-%m-%d'))
-        price_table['dateID'] = price_table['date'].apply(lambda x: datetime.strftime(x, '%Y%m%d'))
-        price_table['dateID'] = price_table['dateID'].astype(int)
+        price_table['date'] = pd.to_datetime(pd.DataFrame({'year': price_table['mp_year'], 'month': price_table['mp_month'], 'day': 1}))
+        price_table['dateID'] = ymd_key(price_table['mp_year'], price_table['mp_month'])
 
         # Rename value (price units) & commodities columns
         price_table = price_table.rename(columns={'mp_price': 'value', 'cm_name': 'commodity_name'})
@@ -262,7 +267,7 @@ class PricesTable:
         Transform prices from Numbeo from local currencies to USD.
         :return: A df with prices in USD and all the fact tables' columns.
         '''
-        numbeo_prices = pd.read_csv(self.path_in + '/price/Numbeo_pricecom.csv', sep=';')
+        numbeo_prices = read_csv_staged(self.path_in + '/price/Numbeo_pricecom.csv', sep=';')
         numbeo_prices = numbeo_prices[numbeo_prices['value'].notna()]
 
         numbeo_norm = pd.merge(numbeo_prices, self.rates, how='left', on=['currency'])
@@ -328,14 +333,12 @@ class PricesTable:
         Loads and treats data from REACH.
         :return: A df with data on prices from REACH and all fact table columns.
         '''
-        reach_all = pd.DataFrame()
         files = s3_glob(self.path_in, 'price', 'price/ULEARN_WFP_UGA_Market')
         print(files)
-        for file in files:
-#        for file in glob.glob(self.path_in + '/price/ULEARN_WFP_UGA_Market*'):
-            reach = pd.read_excel(file, sheet_name='District Mean')
-            reach = reach[['District', 'Regions', 'Period', 'price_maize_g', 'price_maize_f', 'price_beans', 'price_milk']]
-            reach_all = reach_all.append(reach)
+        # The workbooks are read concurrently, each one parsed only the first time it is seen
+        reach_files = thread_map(lambda f: read_excel_staged(f, sheet_name='District Mean'), files)
+        reach_all = pd.concat([reach[['District', 'Regions', 'Period', 'price_maize_g', 'price_maize_f', 'price_beans',
+                                      'price_milk']] for reach in reach_files])
 
         # Add dateID
         periods = {'July_1-14': 20200701, 'July_15-30': 20200715, 'March': 20200301}
@@ -442,7 +445,7 @@ class PricesTable:
         :return: The price table in a parquet format.
         '''
         prices_df = self.add_missing_locIDs()
-        self.flats.export_to_parquet(prices_df, filename)
+        self.flats.export_fact_table(prices_df, filename)
         #self.flats.export_csv_w_date(prices_df, filename) #only for testing purposes
 
 if __name__ == '__main__':
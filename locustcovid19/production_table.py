@@ -11,6 +11,7 @@ Created on Thu Jun 30 15:36:40 2020
 import os
 import pandas as pd
 from utils.flat_files import FlatFiles
+from utils.staging import read_csv_staged
 import numpy as np
 import yaml
 
@@ -35,7 +36,7 @@ class ProductionTable:
     def __init__(self, path_in, path_out):
         self.path_in = path_in
         self.path_out = path_out
-        self.production_df = pd.read_csv(self.path_in + "/production/FAOSTAT_data.csv", sep=",", encoding='utf-8')
+        self.production_df = read_csv_staged(self.path_in + "/production/FAOSTAT_data.csv", sep=",", encoding='utf-8')
         self.locations = pd.read_parquet(self.path_out + "/location_dim/location_table.parquet", engine='pyarrow')
 #        self.locations = pd.read_csv(self.path_out + "location_dim/location_table.csv", sep = "|", encoding='utf-8')[['locationID', 'name']]
         self.flats = FlatFiles(self.path_in, self.path_out)
@@ -89,7 +90,7 @@ class ProductionTable:
         '''
         production_df = self.add_ids_to_table()
         #self.flats.export_csv_w_date(production_df, 'production_table')
-        self.flats.export_to_parquet(production_df, '/production_fact/production_table')
+        self.flats.export_fact_table(production_df, '/production_fact/production_table')
 
 if __name__ == '__main__':
 
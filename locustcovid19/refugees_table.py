@@ -11,7 +11,8 @@ Created on Thu Jun 25 12:18:40 2020
 import os
 import yaml
 import pandas as pd
-from utils.flat_files import FlatFiles
+from utils.flat_files import FlatFiles, ymd_key
+from utils.staging import read_csv_staged
 
 
 COUNTRIES = ["Kenya", "Somalia", "Ethiopia", "Uganda", "South Sudan", "Sudan"]
@@ -23,7 +24,7 @@ class RefugeesTable:
     def __init__(self, path_in, path_out):
         self.path_in = path_in
         self.path_out = path_out
-        self.refugees_df = pd.read_csv(self.path_in + "/social_cohesion/refugees/population.csv", skiprows=14, sep=",", encoding='utf-8')
+        self.refugees_df = read_csv_staged(self.path_in + "/social_cohesion/refugees/population.csv", skiprows=14, sep=",", encoding='utf-8')
         self.flats = FlatFiles(self.path_in, self.path_out)
 
     def convert_to_numeric(self, df):
@@ -48,8 +49,7 @@ class RefugeesTable:
         refugees_df['factID'] = 'REF_' + refugees_df.index.astype(str)
 
         # Add dateID
-        refugees_df['dateID'] = refugees_df['Year'].astype(str) + '0101'
-        refugees_df['dateID'] = refugees_df['dateID'].astype(int)
+        refugees_df['dateID'] = ymd_key(refugees_df['Year'])
 
         # Add locationID
         refugees_df['locationID'] = refugees_df['Country of asylum (ISO)']
@@ -66,7 +66,7 @@ class RefugeesTable:
         refugees_df = self.add_ids()
         #self.flats.export_csv_w_date(refugees_df, 'refugees_table')
         #self.flats.export_parquet_w_date(refugees_df, 'refugees_table')
-        self.flats.export_to_parquet(refugees_df, '/refugees_fact/refugees_table')
+        self.flats.export_fact_table(refugees_df, '/refugees_fact/refugees_table')
 
 if __name__ == '__main__':
 
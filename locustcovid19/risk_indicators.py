@@ -14,6 +14,7 @@ import yaml
 import os
 import pandas as pd
 from utils.flat_files import FlatFiles
+from utils.staging import read_csv_staged
 
 COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
 
@@ -24,8 +25,8 @@ class RiskTables:
         self.flats = FlatFiles(self.path_in, self.path_out)
         self.locations = pd.read_parquet(self.path_out + '/location_dim/location_table.parquet', engine='pyarrow')[
             ['locationID', 'name', 'hierarchy', 'GID_0']]
-        self.locust_risk = pd.read_csv(self.path_in + '/risk/Locustincidencerisk.csv', sep = ';')
-        self.RVF_risk = pd.read_csv(self.path_in + '/risk/RVFrisk.csv', sep = ';')
+        self.locust_risk = read_csv_staged(self.path_in + '/risk/Locustincidencerisk.csv', sep = ';')
+        self.RVF_risk = read_csv_staged(self.path_in + '/risk/RVFrisk.csv', sep = ';')
 
     def location_id_to_risk(self, indicator, country_id):
         # Load files
@@ -71,7 +72,7 @@ class RiskTables:
         '''
         risk_df = self.risk_table(indicator)
         #self.flats.export_csv_w_date(risk_df, indicator + '_risk_table')
-        self.flats.export_to_parquet(risk_df, '/'+ indicator.lower() + '_risk_fact/' + indicator.lower() + '_risk_table')
+        self.flats.export_fact_table(risk_df, '/'+ indicator.lower() + '_risk_fact/' + indicator.lower() + '_risk_table')
 
 if __name__ == '__main__':
 
@@ -13,6 +13,7 @@ import yaml
 import pandas as pd
 import geopandas as gpd
 from utils.shapefiles import Shapefiles
+from utils.projection import area_km2
 
 class ShapefileTable:
     '''
@@ -37,8 +38,8 @@ class ShapefileTable:
         gdf_all = gpd.GeoDataFrame(pd.concat(gdf_all_list, ignore_index=True))
         gdf_all.crs = {"init": "epsg:4326"}
 
-        #Calculate areas in units = degrees
-        gdf_all['area'] = gdf_all['geometry'].area
+        #Calculate areas in km²
+        gdf_all['area'] = area_km2(gdf_all)
         return gdf_all
 
     def export_to_shp(self, gdf, file_name):
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to load the administrative boundaries once and share them between all table classes.
+The concatenated boundaries of each hierarchy are kept in memory for the whole process and stored as a local
+GeoParquet file keyed by the ETags of the source shapefiles, so later runs do not read the shapefiles from S3 again.
+The boundaries projected to the equal-area CRS, used for the areas in km², are kept and stored the same way.
+Data available from: https://gadm.org/download_country_v3.html
+"""
+
+import pandas as pd
+import geopandas as gpd
+from utils.geocache import cached_gdf, hash_key, shapefile_tags
+from utils.projection import EQUAL_AREA_CRS, to_equal_area, projected_area
+
+COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
+
+_boundaries = {}
+_projected_boundaries = {}
+_cache_keys = {}
+
+def shapefile_path(path_in, country, hierarchy):
+    '''
+
+    :param country: The reference country
+    :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
+    :return: The path of the GADM shapefile.
+    '''
+    return path_in + "/Spatial/gadm36_" + country + "_" + str(hierarchy) + ".shp"
+
+def countries_ids(hierarchy):
+    '''
+
+    :param hierarchy: The boundaries level.
+    :return: The countries with boundaries at that level (Somalia has no level 3).
+    '''
+    if hierarchy == 3:
+        return [country for country in COUNTRIES_IDS if country != "SOM"]
+    return COUNTRIES_IDS
+
+def read_boundaries_shp(path_in, country, hierarchy):
+    '''
+
+    :param country: The reference country
+    :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
+    :return: A geodataframe with 3 columns: locationID, GID_0 and geometry.
+    '''
+    gdf_country = gpd.read_file(shapefile_path(path_in, country, hierarchy))
+    GID_column = 'GID_' + str(hierarchy)
+    gdf_country = gdf_country[[GID_column, 'geometry']].rename(columns={GID_column: 'locationID'})
+    gdf_country.insert(1, 'GID_0', country)
+
+    return gdf_country
+
+def cache_key(path_in, hierarchy):
+    '''
+
+    :return: A hash of the ETags of all shapefiles of the hierarchy, read once per process.
+    '''
+    if (path_in, hierarchy) not in _cache_keys:
+        tags = []
+        for country in countries_ids(hierarchy):
+            tags += shapefile_tags(shapefile_path(path_in, country, hierarchy))
+        _cache_keys[(path_in, hierarchy)] = hash_key(tags)
+    return _cache_keys[(path_in, hierarchy)]
+
+def read_boundaries(path_in, hierarchy):
+    '''
+
+    :return: A geodataframe with the boundaries of all countries read from the shapefiles.
+    '''
+    print("... reading boundaries of hierarchy " + str(hierarchy) + " from shapefiles.")
+    gdf_list = [read_boundaries_shp(path_in, country, hierarchy) for country in countries_ids(hierarchy)]
+    return gpd.GeoDataFrame(pd.concat(gdf_list, ignore_index=True), crs='epsg:4326')
+
+def load_boundaries(path_in, hierarchy):
+    '''
+    Reads the boundaries from the local cache, or from the shapefiles if they changed since the cache was written.
+    :return: A geodataframe with the boundaries of all countries.
+    '''
+    return cached_gdf('boundaries', 'gadm36_' + str(hierarchy), cache_key(path_in, hierarchy),
+                      lambda: read_boundaries(path_in, hierarchy))
+
+def get_boundaries(path_in, hierarchy=2):
+    '''
+    Returns the boundaries of all countries for a hierarchy, loading them only once per process.
+    The same geodataframe is handed to every caller, so copy it before adding or changing columns.
+
+    :param path_in: The landing path where the Spatial folder is.
+    :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
+    :return: A geodataframe with 3 columns: locationID, GID_0 and geometry.
+    '''
+    key = (path_in, hierarchy)
+    if key not in _boundaries:
+        _boundaries[key] = load_boundaries(path_in, hierarchy)
+    return _boundaries[key]
+
+def load_projected_boundaries(path_in, hierarchy):
+    '''
+    Reads the projected boundaries from the local cache, or projects them if the shapefiles changed.
+    :return: A geodataframe with the boundaries of all countries in the equal-area CRS.
+    '''
+    key = hash_key([cache_key(path_in, hierarchy), EQUAL_AREA_CRS])
+    return cached_gdf('boundaries', 'gadm36_' + str(hierarchy) + '_equal_area', key,
+                      lambda: to_equal_area(get_boundaries(path_in, hierarchy)))
+
+def get_projected_boundaries(path_in, hierarchy=2):
+    '''
+    Returns the boundaries of all countries for a hierarchy in the equal-area CRS, projecting them only once per process.
+    The rows are in the same order as in get_boundaries. Copy it before adding or changing columns.
+
+    :param path_in: The landing path where the Spatial folder is.
+    :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
+    :return: A geodataframe with 3 columns: locationID, GID_0 and geometry.
+    '''
+    key = (path_in, hierarchy)
+    if key not in _projected_boundaries:
+        _projected_boundaries[key] = load_projected_boundaries(path_in, hierarchy)
+    return _projected_boundaries[key]
+
+def boundary_areas(path_in, hierarchy=2):
+    '''
+
+    :param path_in: The landing path where the Spatial folder is.
+    :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
+    :return: A series indexed like get_boundaries with the area of each boundary in km².
+    '''
+    return projected_area(get_projected_boundaries(path_in, hierarchy).geometry)
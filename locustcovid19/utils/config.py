@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to load the application.yaml configuration once per process, so that helper modules can read
+their settings without the path being passed through every table class.
+"""
+
+import os
+import tempfile
+import yaml
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config/application.yaml')
+
+_config = None
+
+def load_config(filepath=CONFIG_PATH):
+    '''
+    Reads the yaml configuration the first time it is called and returns the same dict afterwards.
+    :param filepath: The path of the yaml file.
+    :return: A dict with the configuration.
+    '''
+    global _config
+    if _config is None:
+        with open(filepath, "r") as ymlfile:
+            _config = yaml.load(ymlfile, Loader=yaml.FullLoader) or {}
+    return _config
+
+def get_setting(section, key, default=None):
+    '''
+
+    :param section: The top level key of application.yaml, e.g. 'cache'.
+    :param key: The key inside the section.
+    :param default: The value returned when the setting is not configured.
+    :return: The configured value or the default.
+    '''
+    values = load_config().get(section) or {}
+    return values.get(key, default)
+
+def cache_dir(name):
+    '''
+    Local directory for the intermediate caches, created if needed.
+    :param name: The subfolder of the cache, one per kind of cached object.
+    :return: The path of the folder, ending with '/'.
+    '''
+    localdir = get_setting('cache', 'localdir', os.path.join(tempfile.gettempdir(), 'locustcovid19'))
+    path = os.path.join(localdir, name, '')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def temp_path(path, suffix=''):
+    '''
+    Creates an empty temporary file in the folder of a cache file, with a name unique to the caller even between threads
+    of the same process, so that the cache file can be written there first and then replaced in one step.
+    :param path: The path of the cache file.
+    :param suffix: The extension of the temporary file, e.g. '.tif'.
+    :return: The path of the temporary file.
+    '''
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix=os.path.basename(path) + '.', dir=os.path.dirname(path))
+    os.close(fd)
+    return tmp_path
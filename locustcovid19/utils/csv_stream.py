@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to read the large source extracts, e.g. the global UCDP events or the WFP prices, without
+loading the whole file in memory. The csv is read in chunks with only the needed columns, and each chunk is filtered
+before the next one is read, so the memory used is proportional to the rows kept. The size of the chunks is set in
+application.yaml:
+
+csv:
+        chunksize: 100000
+"""
+
+import pandas as pd
+from utils.config import get_setting
+
+CSV_CHUNK_SIZE = 100000
+
+def chunk_size():
+    '''
+
+    :return: The number of rows read at once.
+    '''
+    return int(get_setting('csv', 'chunksize', CSV_CHUNK_SIZE))
+
+def read_csv_filtered(path, rows=None, usecols=None, **kwargs):
+    '''
+    Reads a csv in chunks, keeping only the rows and columns needed.
+    :param path: The path of the csv.
+    :param rows: A function returning a boolean mask of the rows to keep in a chunk, all rows if not given.
+    :param usecols: The columns to read, a list or a function of the column name, as in pd.read_csv.
+    :param kwargs: Any other argument of pd.read_csv, e.g. sep or encoding.
+    :return: A df with the rows kept, indexed by their line number in the file as if the whole file had been read.
+    '''
+    chunks = pd.read_csv(path, usecols=usecols, chunksize=chunk_size(), **kwargs)
+    kept = [chunk[rows(chunk)] if rows is not None else chunk for chunk in chunks]
+    return pd.concat(kept)
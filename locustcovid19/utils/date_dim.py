@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to provide the Date dimension to all table classes without reading Date_Dim.csv from the
+reporting bucket for every table. The calendar is a pure function of its date range: generate_dates is the one
+definition of it, stored as parquet by utils.date_table and generated in memory once per process for the dateIDs of
+the tables. The CSV is read instead only if dates.csv is set in application.yaml.
+"""
+
+import numpy as np
+import pandas as pd
+from utils.config import get_setting
+
+DATE_DIM_START = '2000-01-01'
+DATE_DIM_END = '2030-12-31'
+DATE_KEYS = ['dateID', 'date']
+
+_date_dim = None
+
+def generate_dates(start, end):
+    '''
+
+    :param start: The first date of the calendar, e.g. '2000-01-01'.
+    :param end: The last date of the calendar.
+    :return: A df with one row per day: the dateID as a YYYYMMDD integer, the date, the year, the month, the
+    dekad of the year (1 to 36, as the eMODIS periods) and the quarter.
+    '''
+    days = pd.date_range(start, end, freq='D')
+    return pd.DataFrame({'dateID': days.year * 10000 + days.month * 100 + days.day, 'date': days,
+                         'year': days.year, 'month': days.month,
+                         'dekad': (days.month - 1) * 3 + np.minimum((days.day - 1) // 10, 2) + 1,
+                         'quarter': days.quarter})
+
+def read_dates(csv_path):
+    '''
+
+    :param csv_path: The path of a Date_Dim.csv file.
+    :return: The dateID and date columns of the file.
+    '''
+    dates = pd.read_csv(csv_path, sep=",")[DATE_KEYS]
+    dates['date'] = pd.to_datetime(dates['date'])
+    return dates
+
+def date_dim():
+    '''
+    Returns the keys of the Date dimension, generated or read the first time it is called. The df is shared, copy it
+    before changing it.
+    :return: A df with the dateID and date columns of generate_dates, from dates.start to dates.end in
+    application.yaml, so that merging it on the date adds only the dateID.
+    '''
+    global _date_dim
+    if _date_dim is None:
+        csv_path = get_setting('dates', 'csv')
+        if csv_path:
+            print("... reading the Date dimension from " + csv_path)
+            _date_dim = read_dates(csv_path)
+        else:
+            _date_dim = generate_dates(get_setting('dates', 'start', DATE_DIM_START),
+                                       get_setting('dates', 'end', DATE_DIM_END))[DATE_KEYS]
+    return _date_dim
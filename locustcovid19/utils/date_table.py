@@ -2,48 +2,98 @@
 # coding: utf-8
 """
 Script to create the calendar (date table).
+The Date dimension is the calendar of utils.date_dim.generate_dates, stored as parquet files in the Date_Dim_Parquet
+folder of the reporting bucket, apart from the Date_Dim folder of the legacy Date_Dim.csv so that a table over either
+folder reads a single format. Extending the calendar writes only the dates after the last stored one, in a new file
+of the same folder, so the files already exported are never rewritten.
 
 @author: alicja.grochocka@gmail.com
 """
 
 #Imports
-#import datetime
+import os
+import yaml
+import fsspec
 import pandas as pd
-from datetime import timedelta, date
+from utils.date_dim import generate_dates, DATE_DIM_START, DATE_DIM_END
+
+DATE_DIM_FOLDER = '/Date_Dim_Parquet'
 
 class DataGenerator:
     '''
     This class generates the Date Dimension table.
     '''
-    
+
     def __init__ (self, range_start, range_end):
-        self.range_start = range_start
-        self.range_end = range_end
+        self.range_start = pd.Timestamp(range_start)
+        self.range_end = pd.Timestamp(range_end)
         self.generate()
-              
-    def daterange(self):
-        '''
-        Function to establish the date range.
-        :return:
-        '''
-        for n in range(int ((self.range_end - self.range_start).days)+1):
-            yield self.range_start + timedelta(n)
-            
+
     def generate(self):
         '''
 
-        :return: A df with two date columns.
+        :return: A df with one row per day, see utils.date_dim.generate_dates.
         '''
-        self.rows_list = []
-        for dt in self.daterange():
-            self.rows_list.append([dt.strftime("%Y%m%d"),dt.strftime("%Y-%m-%d")])
-        self.df = pd.DataFrame(self.rows_list)
-        
-start_dt = date(2000, 1, 1) 
-end_dt = date(2023,1, 1)
-datagenerator = DataGenerator(start_dt, end_dt)
-
-df2=datagenerator.df
-df2.rename(columns={0: "dateID", 1: "date"}, inplace=True)
-df2.to_parquet('data_parquet',
-              index = False)
+        self.df = generate_dates(self.range_start, self.range_end)
+        return self.df
+
+def date_dim_files(path_out):
+    '''
+
+    :param path_out: The reporting path.
+    :return: The filesystem of the reporting path and the parquet files of the Date dimension.
+    '''
+    fs, _, paths = fsspec.get_fs_token_paths(path_out + DATE_DIM_FOLDER)
+    return fs, fs.glob(paths[0] + '/date_dim_*.parquet')
+
+def last_date(path_out):
+    '''
+
+    :param path_out: The reporting path.
+    :return: The last date of the stored Date dimension, None if nothing is stored yet.
+    '''
+    fs, files = date_dim_files(path_out)
+    last = None
+    for f in files:
+        with fs.open(f, 'rb') as parquet_file:
+            date_ids = pd.read_parquet(parquet_file, columns=['dateID'])['dateID']
+        if len(date_ids) and (last is None or date_ids.max() > last):
+            last = date_ids.max()
+    return None if last is None else pd.to_datetime(str(last), format='%Y%m%d')
+
+def extend_date_dim(path_out, range_end=DATE_DIM_END, range_start=DATE_DIM_START):
+    '''
+    Appends the dates after the last stored one up to range_end as a new file of the Date dimension.
+    :param path_out: The reporting path.
+    :param range_end: The last date of the calendar.
+    :param range_start: The first date of the calendar, used only if nothing is stored yet.
+    :return: The df with the new dates, None if the calendar already reaches range_end.
+    '''
+    last = last_date(path_out)
+    first = pd.Timestamp(range_start) if last is None else last + pd.Timedelta(days=1)
+    if first > pd.Timestamp(range_end):
+        print("... the Date dimension already reaches " + str(range_end))
+        return None
+
+    df = DataGenerator(first, range_end).df
+    path = (path_out + DATE_DIM_FOLDER + '/date_dim_' + str(df['dateID'].iloc[0]) + '_' + str(df['dateID'].iloc[-1])
+            + '.parquet')
+    if '://' not in path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with fsspec.open(path, 'wb') as f:
+        df.to_parquet(f, index=False)
+    print(str(len(df)) + " dates exported to " + path)
+    return df
+
+
+if __name__ == '__main__':
+
+    filepath = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config/application.yaml')
+    with open(filepath, "r") as ymlfile:
+        cfg = yaml.load(ymlfile, Loader=yaml.FullLoader)
+
+    OUTPUT_PATH = cfg['data']['reporting']
+    dates_cfg = cfg.get('dates') or {}
+
+    print("------- Extending date dimension ---------")
+    extend_date_dim(OUTPUT_PATH, dates_cfg.get('end', DATE_DIM_END), dates_cfg.get('start', DATE_DIM_START))
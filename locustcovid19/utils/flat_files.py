@@ -7,10 +7,74 @@ Created on Sat Jun 04 09:36:40 2020
 @author: ioanna.papachristou@accenture.com
 """
 # Imports
+import os
 import time
+import fsspec
 import pandas as pd
-import boto3
-client = boto3.client('s3')
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.config import get_setting
+
+FACT_COMPRESSION = 'zstd'
+FACT_ROW_GROUP_SIZE = 500000
+HIVE_DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+DICTIONARY_STRING = pa.dictionary(pa.int32(), pa.string())
+FACT_TYPES = {'factID': pa.string(), 'measureID': pa.int32(), 'dateID': pa.int32(), 'locationID': DICTIONARY_STRING,
+              'value': pa.float64()}
+
+def ymd_key(year, month=1, day=1):
+    '''
+    Builds the integer dateID of the Date_Dim with arithmetic on whole columns, without formatting any date.
+    :param year: A series or array with the years, as numbers or strings.
+    :param month: The months, a series, an array or a single value.
+    :param day: The days, a series, an array or a single value.
+    :return: The dateIDs as nullable Int32 YYYYMMDD integers, e.g. 20200101, <NA> where the year is missing.
+    '''
+    keys = pd.to_numeric(year) * 10000 + pd.to_numeric(month) * 100 + pd.to_numeric(day)
+    return keys.astype('Int32') if isinstance(keys, pd.Series) else pd.array(keys, dtype='Int32')
+
+def date_key(dates, format=None):
+    '''
+
+    :param dates: A series with datetimes, or with strings parsed by pd.to_datetime.
+    :param format: The format of the strings, e.g. '%Y-%m-%d'.
+    :return: A series with the dateIDs as nullable Int32 YYYYMMDD integers, <NA> where the date is missing.
+    '''
+    dates = pd.to_datetime(pd.Series(dates), format=format)
+    return ymd_key(dates.dt.year, dates.dt.month, dates.dt.day)
+
+def fact_array(series, data_type):
+    '''
+
+    :param series: A column of a fact table.
+    :param data_type: The arrow type of the column.
+    :return: The column as an arrow array, with nulls for the missing values.
+    '''
+    if pa.types.is_integer(data_type):
+        return pa.array(pd.to_numeric(series).astype('Int32'), type=data_type)
+    if pa.types.is_floating(data_type):
+        return pa.array(pd.to_numeric(series).astype('float64'), type=data_type, from_pandas=True)
+    strings = pa.array(series.astype(str).where(series.notnull(), None), type=pa.string(), from_pandas=True)
+    return strings.dictionary_encode() if pa.types.is_dictionary(data_type) else strings
+
+def fact_table(df):
+    '''
+    Converts a fact table to the fixed schema of the fact tables: int32 measureID and dateID, dictionary encoded
+    locationID, float64 value and string factID. Any other column, e.g. commodity_name, is a dictionary encoded string.
+    :param df: The fact table.
+    :return: An arrow table.
+    '''
+    arrays = [fact_array(df[column], FACT_TYPES.get(column, DICTIONARY_STRING)) for column in df.columns]
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+def partition_values(series):
+    '''
+
+    :param series: A numeric column.
+    :return: The values as strings for the partition paths, with the Hive default partition for the missing ones.
+    '''
+    values = pd.to_numeric(series)
+    return values.fillna(0).astype('int64').astype(str).where(values.notnull(), HIVE_DEFAULT_PARTITION)
 
 class FlatFiles:
     '''
@@ -28,13 +92,11 @@ class FlatFiles:
 
         :param df: The dataframe that includes the column to be transform to datetime
         :param column: The column to be transform to datetime
-        :return: The initial dataframe adding the dateID column
+        :return: The initial dataframe adding the dateID column of the 1st of January of the year, as nullable Int32
         '''
-        # Merge with dates and add dateID
-        self.dates = pd.read_csv(self.path_out + '/Date_Dim/Date_Dim.csv', sep=",")
-        self.dates['date'] = pd.to_datetime(self.dates['date'])
-        df[column] = pd.to_datetime([f'{y}-01-01' for y in df[column]])
-        df = df.merge(self.dates, left_on=column, right_on='date', how='left')
+        years = pd.to_numeric(df[column])
+        df[column] = pd.to_datetime(pd.DataFrame({'year': years, 'month': 1, 'day': 1}))
+        df['dateID'] = ymd_key(years)
         return df
 
     def select_columns_fact_table(self, df):
@@ -65,6 +127,50 @@ class FlatFiles:
         df.to_parquet(self.path_out + file_name + ".parquet", index=False)
         print("Dataframe exported to parquet format")
 
+    def write_fact_file(self, df, path):
+        '''
+        Writes a fact table with its fixed schema, the compression and the row group size set in application.yaml.
+
+        :param df: The fact table
+        :param path: The path of the parquet file
+        '''
+        if '://' not in path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with fsspec.open(path, 'wb') as f:
+            pq.write_table(fact_table(df), f, compression=get_setting('facts', 'compression', FACT_COMPRESSION),
+                           row_group_size=int(get_setting('facts', 'row_group_size', FACT_ROW_GROUP_SIZE)))
+
+    def export_fact_table(self, df, file_name, partitions=None):
+        '''
+        Exports a fact table to parquet with the fixed schema of fact_table. If facts.partitioned is set in
+        application.yaml, the table is a hive partitioned dataset by measureID and year of the dateID,
+        e.g. /conflict_fact/measureID=32/year=2020/conflict_table.parquet, otherwise a single file as export_to_parquet.
+        The partition columns are not stored in the files.
+
+        :param df: The fact table to be exported
+        :param file_name: the name of the file to be exported, e.g. '/conflict_fact/conflict_table'
+        :param partitions: The partition columns, 'measureID' and/or 'year', read from facts.partitioned if not given,
+        e.g. ['year'] for /population_fact/year=2020/population_table.parquet or [] for a single file.
+        '''
+        if partitions is None:
+            partitions = ['measureID', 'year'] if get_setting('facts', 'partitioned', False) else []
+        if not partitions:
+            self.write_fact_file(df, self.path_out + file_name + ".parquet")
+            print("Fact table exported to parquet format")
+            return
+
+        folder, name = file_name.rsplit('/', 1)
+        keys = {'measureID': lambda: partition_values(df['measureID']),
+                'year': lambda: partition_values(pd.to_numeric(df['dateID']) // 10000)}
+        groups = pd.DataFrame({column: keys[column]() for column in partitions})
+        for values, positions in sorted(groups.groupby(partitions).indices.items()):
+            values = values if isinstance(values, tuple) else (values,)
+            path = self.path_out + folder + ''.join('/' + column + '=' + value
+                                                    for column, value in zip(partitions, values)) + '/' + name
+            self.write_fact_file(df.iloc[positions].drop(columns=[column for column in partitions if column in df]),
+                                 path + '.parquet')
+        print("Fact table exported to " + str(len(groups.drop_duplicates())) + " partitions in parquet format")
+
     def export_to_csv(self, df, file_name):
         '''
         Exports a dataframe to a parquet format.
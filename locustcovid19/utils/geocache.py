@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to store intermediate geodataframes as GeoParquet files, keyed by a hash of the
+versions of their inputs, so that they are only calculated again when the inputs change. The files are kept in the
+local cache folder, or in a folder of the reporting bucket for the caches that have to outlive the instance of a run,
+as every run starts on a new EC2 instance.
+"""
+
+import hashlib
+import io
+import os
+import fsspec
+import geopandas as gpd
+from utils.config import cache_dir, temp_path
+from utils.s3_etag import s3_etag
+
+SHP_EXTENSIONS = ['.shp', '.shx', '.dbf']
+
+def hash_key(tags):
+    '''
+
+    :param tags: A list of strings identifying the versions of the inputs, e.g. ETags.
+    :return: A hash of all tags.
+    '''
+    return hashlib.md5('|'.join(tags).encode('utf-8')).hexdigest()
+
+def shapefile_tags(shp_path):
+    '''
+
+    :param shp_path: The path of a .shp file.
+    :return: The ETags of the .shp and its .shx and .dbf files.
+    '''
+    return [s3_etag(shp_path[:-4] + extension) for extension in SHP_EXTENSIONS]
+
+def read_cached(path, reader):
+    '''
+
+    :param path: The local or s3 path of a cached file.
+    :param reader: The function parsing the open file, e.g. gpd.read_parquet.
+    :return: The parsed file, None if it is not cached.
+    '''
+    try:
+        with fsspec.open(path, 'rb') as f:
+            return reader(f)
+    except FileNotFoundError:
+        return None
+
+def write_cached(path, writer):
+    '''
+    Writes a cached file in one step, so that concurrent runs never read a half written cache: the content is
+    serialized in memory first, then put as one s3 object or written to a temporary file replacing the local file.
+    :param path: The local or s3 path of the cached file.
+    :param writer: The function writing the content to a binary file, e.g. lambda f: gdf.to_parquet(f).
+    '''
+    buffer = io.BytesIO()
+    writer(buffer)
+    if '://' in path:
+        with fsspec.open(path, 'wb') as f:
+            f.write(buffer.getvalue())
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def remove_stale(store_dir, name, key):
+    '''
+    Removes the files cached for older versions of the inputs, e.g. of the previous days.
+    :param store_dir: The folder of the cached files.
+    :param name: The name of the cached files, without the key.
+    :param key: The hash of the current version, its file is kept.
+    '''
+    fs, _, paths = fsspec.get_fs_token_paths(store_dir)
+    current = name + '_' + key + '.parquet'
+    for stale in fs.glob(paths[0].rstrip('/') + '/' + name + '_' + '?' * len(key) + '.parquet'):
+        if not stale.endswith('/' + current):
+            fs.rm(stale)
+
+def cached_gdf(folder, name, key, func, store_dir=None):
+    '''
+    Reads a geodataframe from the cache or calculates and stores it.
+    :param folder: The local cache folder.
+    :param name: The name of the cached file, without extension.
+    :param key: The hash of the inputs, see hash_key.
+    :param func: The function calculating the geodataframe when it is not cached.
+    :param store_dir: A local or s3 folder where the file is kept instead of the local cache folder, only the file of
+    the latest key is kept there.
+    :return: The geodataframe.
+    '''
+    cache_path = (store_dir.rstrip('/') + '/' if store_dir else cache_dir(folder)) + name + '_' + key + '.parquet'
+    gdf = read_cached(cache_path, gpd.read_parquet)
+    if gdf is not None:
+        print("... reading cached " + cache_path)
+        return gdf
+
+    gdf = func()
+    write_cached(cache_path, lambda f: gdf.to_parquet(f, index=False))
+    if store_dir:
+        remove_stale(store_dir, name, key)
+
+    return gdf
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to intersect two layers of polygons, e.g. the locust buffers or the famine areas with the
+districts, as gpd.overlay(how='intersection') does but without clipping every pair of polygons.
+The candidate pairs come from one bulk query of the spatial index of the second layer, so only the polygons that really
+intersect are clipped. A polygon fully inside the other one is taken as it is, without any clipping.
+"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import MultiPolygon
+from shapely.ops import unary_union
+
+POLYGON_TYPES = ['Polygon', 'MultiPolygon']
+
+def polygonal_part(geom):
+    '''
+    Keeps the polygons of an intersection, as overlay does for polygon layers: polygons sharing only a border or a
+    corner intersect in lines or points, which are dropped.
+    :param geom: The intersection of two polygons.
+    :return: A (multi)polygon, or None if the intersection has no area.
+    '''
+    if geom is None or geom.is_empty:
+        return None
+    if geom.geom_type in POLYGON_TYPES:
+        return geom
+    if geom.geom_type == 'GeometryCollection':
+        polygons = [part for part in geom.geoms if part.geom_type in POLYGON_TYPES]
+        if polygons:
+            union = unary_union(polygons)
+            return union if union.geom_type in POLYGON_TYPES else MultiPolygon(polygons)
+    return None
+
+def intersection_pairs(gdf_left, gdf_right):
+    '''
+    Finds the pairs of intersecting polygons and calculates the geometry of their intersection.
+    :return: The positions of the left and right polygons of each pair, and the geometries of the intersections.
+    '''
+    left = gdf_left.geometry.reset_index(drop=True)
+    right = gdf_right.geometry.reset_index(drop=True)
+    left_geoms = np.asarray(left, dtype=object)
+    right_geoms = np.asarray(right, dtype=object)
+
+    # Candidates: the spatial index prunes by bounding box, then the predicate is tested on the polygons
+    pairs = right.sindex.query(left, predicate='intersects')
+    order = np.lexsort((pairs[1], pairs[0]))
+    pairs = pairs[:, order]
+
+    # Containment fast paths, no clipping needed
+    left_candidates = gpd.GeoSeries(left_geoms[pairs[0]])
+    right_candidates = gpd.GeoSeries(right_geoms[pairs[1]])
+    right_inside = np.asarray(left_candidates.contains(right_candidates), dtype=bool)
+    left_inside = np.asarray(left_candidates.within(right_candidates), dtype=bool) & ~right_inside
+
+    geometries = np.empty(pairs.shape[1], dtype=object)
+    geometries[right_inside] = right_geoms[pairs[1][right_inside]]
+    geometries[left_inside] = left_geoms[pairs[0][left_inside]]
+
+    # Exact intersections for the polygons that overlap partially
+    clip = ~(right_inside | left_inside)
+    if clip.any():
+        clipped = left_candidates[clip].intersection(right_candidates[clip])
+        geometries[clip] = [polygonal_part(geom) for geom in clipped]
+
+    keep = np.array([geom is not None for geom in geometries], dtype=bool)
+    return pairs[0][keep], pairs[1][keep], list(geometries[keep])
+
+def intersect_polygons(gdf_left, gdf_right):
+    '''
+    Intersects two layers of polygons.
+    :param gdf_left: The first layer, e.g. the locust buffers.
+    :param gdf_right: The second layer, e.g. the districts, in the same CRS.
+    :return: A gdf with one row per pair of intersecting polygons, with the columns of both layers (suffixed _1 and
+    _2 when in both) and the geometry of their intersection, ordered by the position of the left polygon and then of
+    the right one. The rows are those of gpd.overlay(how='intersection'), not in the same order.
+    '''
+    left_positions, right_positions, geometries = intersection_pairs(gdf_left, gdf_right)
+
+    df_left = pd.DataFrame(gdf_left.drop(columns=gdf_left.geometry.name)).iloc[left_positions].reset_index(drop=True)
+    df_right = pd.DataFrame(gdf_right.drop(columns=gdf_right.geometry.name)).iloc[right_positions].reset_index(drop=True)
+    common = df_left.columns.intersection(df_right.columns)
+    df_left = df_left.rename(columns={column: column + '_1' for column in common})
+    df_right = df_right.rename(columns={column: column + '_2' for column in common})
+
+    return gpd.GeoDataFrame(pd.concat([df_left, df_right], axis=1), geometry=geometries, crs=gdf_left.crs)
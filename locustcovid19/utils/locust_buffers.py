@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to calculate the monthly locust buffers shared by the forageland and cropland locust tables:
+the swarms are buffered by 25km and the overlapping buffers of each month are unioned.
+
+In incremental mode the unioned buffers of every month are stored as GeoParquet in the reporting bucket together with a
+hash of the OBJECTIDs of the swarms of that month. Only the months whose swarms changed are calculated again.
+The unions of the months are independent and can run in a pool of processes. Both are set in application.yaml:
+
+locust:
+        incremental: true
+        workers: 1
+"""
+
+import fsspec
+import pandas as pd
+import geopandas as gpd
+from utils.config import get_setting
+from utils.geocache import hash_key
+from utils.parallel import parallel_map, workers_setting
+from utils.projection import UTM_CRS, buffer_meters
+from shapely.ops import unary_union
+
+BUFFER_LENGTH_IN_METERS = 25 * 1000 # buffer: 25km
+
+def incremental_setting():
+    '''
+
+    :return: True if the monthly buffers are calculated incrementally.
+    '''
+    return bool(get_setting('locust', 'incremental', False))
+
+def calc_buffer(locust_gdf):
+    '''
+
+    :param locust_gdf: The swarms.
+    :return: A gdf with locust buffers of 25km, calculated in meters in the UTM zone of each swarm and reprojected to
+    degrees.
+    '''
+    return buffer_meters(locust_gdf, BUFFER_LENGTH_IN_METERS)
+
+def union_geometries(geometries):
+    '''
+    Unions the buffers of one month. Runs in the worker processes.
+    :param geometries: A list with the buffers of the month.
+    :return: The union of the buffers.
+    '''
+    return unary_union(geometries)
+
+def dissolve_by_month(buffers_gdf, workers):
+    '''
+    Unions the buffers of each month, in one grouped dissolve or with the months spread over a pool of processes.
+    :param buffers_gdf: The buffers with their year and month.
+    :param workers: The number of processes.
+    :return: A gdf with one (multi)polygon per year and month.
+    '''
+    if workers <= 1:
+        return buffers_gdf[['year', 'month', 'geometry']].dissolve(by=['year', 'month']).reset_index()
+
+    groups = buffers_gdf.groupby(['year', 'month'])['geometry']
+    keys = list(groups.groups)
+    unions = parallel_map(union_geometries, [list(geometries) for _, geometries in groups], workers)
+    return gpd.GeoDataFrame(pd.DataFrame(keys, columns=['year', 'month']), geometry=unions, crs=buffers_gdf.crs)
+
+def union_by_month(buffers_gdf, workers=None):
+    '''
+    Unions the overlapping buffers grouped by month and year.
+    :param buffers_gdf: The buffers of the swarms with their STARTDATE.
+    :param workers: The number of processes for the unions of the months, read from application.yaml if not given.
+    :return: A gdf with the final buffer geometries and their year, month and date.
+    '''
+    if len(buffers_gdf) == 0:
+        return gpd.GeoDataFrame(columns=['year', 'month', 'date', 'geometry'], geometry='geometry', crs=buffers_gdf.crs)
+    if workers is None:
+        workers = workers_setting('locust')
+
+    buffers_gdf = buffers_gdf.assign(year=buffers_gdf['STARTDATE'].dt.year, month=buffers_gdf['STARTDATE'].dt.month)
+    month_buffers = dissolve_by_month(buffers_gdf, workers)
+
+    # Split the unions into the separate buffers
+    month_buffers = month_buffers.explode().reset_index(drop=True)
+    month_buffers['date'] = pd.to_datetime(month_buffers[['year', 'month']].assign(day=1))
+
+    return month_buffers[['year', 'month', 'date', 'geometry']]
+
+def buffer_tags():
+    '''
+
+    :return: The settings of the buffers, hashed with the OBJECTIDs so that stored buffers calculated differently are
+    calculated again.
+    '''
+    return [UTM_CRS, str(BUFFER_LENGTH_IN_METERS)]
+
+def month_hashes(locust_gdf):
+    '''
+
+    :param locust_gdf: The swarms.
+    :return: A series indexed by year and month with a hash of the OBJECTIDs of the swarms of the month.
+    '''
+    swarms = pd.DataFrame({'year': locust_gdf['STARTDATE'].dt.year, 'month': locust_gdf['STARTDATE'].dt.month,
+                           'OBJECTID': locust_gdf['OBJECTID'].astype(str)})
+    return swarms.groupby(['year', 'month'])['OBJECTID'].apply(lambda ids: hash_key(buffer_tags() + sorted(ids))).rename('objects_hash')
+
+def read_buffers(path):
+    '''
+
+    :param path: The path of the stored monthly buffers.
+    :return: A gdf with the stored monthly buffers, or None if they were never stored.
+    '''
+    try:
+        with fsspec.open(path, 'rb') as f:
+            return gpd.read_parquet(f)
+    except FileNotFoundError:
+        print("... no stored locust buffers in " + path)
+        return None
+
+def write_buffers(gdf, path):
+    '''
+
+    :param gdf: The monthly buffers.
+    :param path: The path of the stored monthly buffers.
+    '''
+    with fsspec.open(path, 'wb') as f:
+        gdf.to_parquet(f, index=False)
+    print("Locust buffers exported to " + path)
+
+def monthly_buffers(locust_gdf, store_path=None):
+    '''
+    Calculates the unioned buffers per month. When store_path is given, only the months whose swarms changed since the
+    buffers were stored are calculated again, and the store is updated.
+
+    :param locust_gdf: The filtered swarms.
+    :param store_path: The path of the stored monthly buffers, None to calculate all months.
+    :return: A gdf with the final buffer geometries and their year, month and date.
+    '''
+    if store_path is None:
+        return union_by_month(calc_buffer(locust_gdf))
+
+    hashes = month_hashes(locust_gdf)
+    stored = read_buffers(store_path)
+
+    if stored is None:
+        unchanged = pd.MultiIndex.from_tuples([], names=['year', 'month'])
+        stored_kept = None
+    else:
+        stored_hashes = stored.groupby(['year', 'month'])['objects_hash'].first()
+        same = stored_hashes.reindex(hashes.index) == hashes
+        unchanged = hashes.index[same.values]
+        stored_kept = stored[pd.MultiIndex.from_frame(stored[['year', 'month']]).isin(unchanged)]
+
+    swarm_months = pd.MultiIndex.from_arrays([locust_gdf['STARTDATE'].dt.year, locust_gdf['STARTDATE'].dt.month])
+    changed_swarms = locust_gdf[~swarm_months.isin(unchanged)]
+    print("... " + str(len(hashes) - len(unchanged)) + " months of locust buffers to calculate, " +
+          str(len(unchanged)) + " unchanged.")
+
+    if stored is not None and len(changed_swarms) == 0 and len(stored_kept) == len(stored):
+        return stored
+
+    new_buffers = union_by_month(calc_buffer(changed_swarms))
+    new_buffers = new_buffers.merge(hashes.reset_index(), on=['year', 'month'], how='left')
+
+    buffers = pd.concat([df for df in [stored_kept, new_buffers] if df is not None], ignore_index=True)
+    buffers = gpd.GeoDataFrame(buffers.sort_values(['year', 'month'], kind='mergesort').reset_index(drop=True),
+                               geometry='geometry', crs='epsg:4326')
+    write_buffers(buffers, store_path)
+
+    return buffers
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to run independent jobs in a pool of processes.
+The number of processes is set in application.yaml:
+
+processing:
+        workers: 4
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from utils.config import get_setting
+
+def workers_setting(section='processing'):
+    '''
+
+    :param section: The section of application.yaml with the workers setting.
+    :return: The number of worker processes configured, 1 if not configured and all cpus if set to 0.
+    '''
+    workers = int(get_setting(section, 'workers', 1))
+    if workers == 0:
+        workers = os.cpu_count()
+    return workers
+
+def parallel_map(func, items, workers=None):
+    '''
+    Applies func to each item, in a pool of processes when more than one worker is configured.
+    func has to be a module level function so that it can be sent to the workers.
+
+    :param func: The function to apply.
+    :param items: The arguments, one per job.
+    :param workers: The number of processes, read from application.yaml if not given.
+    :return: A list of the results in the same order as items, whatever the order the jobs finished in.
+    '''
+    items = list(items)
+    if workers is None:
+        workers = workers_setting()
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(func, items))
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to calculate areas and buffers in projections instead of in degrees.
+All datasets are in EPSG:4326; the Africa Albers Equal Area Conic projection (ESRI:102022) keeps the areas of the
+whole region true, so every area column is in km². It does not keep distances, its scale differs by several percent
+along the parallels and the meridians, so the buffers are drawn in the UTM zone of each geometry instead, where
+distances are true within 0.1% in every direction.
+"""
+
+import numpy as np
+import geopandas as gpd
+
+EQUAL_AREA_CRS = '+proj=aea +lat_1=20 +lat_2=-23 +lat_0=0 +lon_0=25 +x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs'
+GEOGRAPHIC_CRS = 'epsg:4326'
+UTM_CRS = '+proj=utm +zone={} +datum=WGS84 +units=m +no_defs'
+
+def to_equal_area(gdf):
+    '''
+
+    :param gdf: A gdf or geoseries in EPSG:4326.
+    :return: The same gdf projected to the equal-area CRS.
+    '''
+    return gdf.to_crs(EQUAL_AREA_CRS)
+
+def to_geographic(gdf):
+    '''
+
+    :param gdf: A gdf or geoseries in the equal-area CRS.
+    :return: The same gdf in EPSG:4326.
+    '''
+    return gdf.to_crs(GEOGRAPHIC_CRS)
+
+def projected_area(geometries):
+    '''
+
+    :param geometries: A geoseries already in the equal-area CRS.
+    :return: A series with the area of each geometry in km².
+    '''
+    return geometries.area / 10 ** 6
+
+def area_km2(gdf):
+    '''
+    Calculates the true areas of geometries given in EPSG:4326.
+    :param gdf: A gdf or geoseries in EPSG:4326.
+    :return: A series indexed like gdf with the area of each geometry in km².
+    '''
+    return projected_area(to_equal_area(gdf.geometry))
+
+def utm_zones(geometries):
+    '''
+
+    :param geometries: A geoseries in EPSG:4326.
+    :return: An array with the UTM zone of the centre of the bounds of each geometry.
+    '''
+    bounds = geometries.bounds
+    lon = (bounds['minx'].values + bounds['maxx'].values) / 2
+    return np.clip(np.floor((lon + 180) / 6).astype(int) + 1, 1, 60)
+
+def buffer_meters(gdf, distance):
+    '''
+    Buffers geometries given in EPSG:4326 by a true distance, each one in the UTM zone it falls in.
+    :param gdf: A gdf in EPSG:4326.
+    :param distance: The buffer distance in meters.
+    :return: A copy of gdf with the buffers as geometry, in EPSG:4326.
+    '''
+    zones = utm_zones(gdf.geometry)
+    buffers = np.empty(len(gdf), dtype=object)
+    for zone in np.unique(zones):
+        in_zone = zones == zone
+        buffered = gdf.geometry[in_zone].to_crs(UTM_CRS.format(zone)).buffer(distance).to_crs(GEOGRAPHIC_CRS)
+        buffers[in_zone] = buffered.values
+    return gdf.set_geometry(gpd.GeoSeries(buffers, index=gdf.index, crs=GEOGRAPHIC_CRS))
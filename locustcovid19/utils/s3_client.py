@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to share one boto3 s3 client per process, created the first time it is used, so that the
+modules that never call s3 directly do not pay the import of boto3 and the creation of a client.
+The connection pool of the client is sized for the download threads of utils.s3_fetch.
+"""
+
+import threading
+from utils.config import get_setting
+
+FETCH_WORKERS = 8
+
+_client = None
+_lock = threading.Lock()
+
+def fetch_workers():
+    '''
+
+    :return: The number of download threads of utils.s3_fetch, s3.fetch_workers in application.yaml.
+    '''
+    return max(int(get_setting('s3', 'fetch_workers', FETCH_WORKERS)), 1)
+
+def s3_client():
+    '''
+
+    :return: The boto3 s3 client of the process.
+    '''
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import boto3
+                from botocore.config import Config
+                pool_size = max(fetch_workers(), 10)
+                _client = boto3.client('s3', config=Config(max_pool_connections=pool_size))
+    return _client
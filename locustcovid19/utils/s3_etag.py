@@ -0,0 +1,23 @@
+import os
+from utils.s3_client import s3_client
+
+def split_s3_path(path):
+    '''
+
+    :param path: A path in the form 's3://bucket/key'.
+    :return: The bucket and the key.
+    '''
+    bucket, _, key = path[5:].partition('/')
+    return bucket, key.replace('//', '/').lstrip('/')
+
+def s3_etag(path):
+    '''
+    Identifies the current version of a file, used to key the local caches.
+    :param path: An s3 path or a local path.
+    :return: The ETag of the s3 object, or the size and modification time of a local file.
+    '''
+    if path.startswith('s3://'):
+        bucket, key = split_s3_path(path)
+        return s3_client().head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+    stat = os.stat(path)
+    return str(stat.st_size) + '-' + str(int(stat.st_mtime))
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to read many small s3 objects, e.g. the intermediate csv files or the famine shapefiles,
+concurrently instead of one after the other, as their reading time is mostly the latency of each request.
+The objects are downloaded by a pool of threads sharing one boto3 client, whose connection pool is as large as the
+pool of threads, and each thread parses the object it downloaded straight away. At most one object per thread is
+held in memory, or in a temporary folder for the shapefiles. The number of threads is set in application.yaml:
+
+s3:
+        fetch_workers: 8
+"""
+
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from utils.s3_etag import split_s3_path
+from utils.s3_client import s3_client, fetch_workers
+
+SHAPEFILE_EXTENSIONS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+REQUIRED_EXTENSIONS = ['.shp', '.shx', '.dbf']
+
+def fetch_object(path):
+    '''
+
+    :param path: An s3 path or a local path.
+    :return: The content of the object in a file-like buffer.
+    '''
+    if path.startswith('s3://'):
+        bucket, key = split_s3_path(path)
+        return io.BytesIO(s3_client().get_object(Bucket=bucket, Key=key)['Body'].read())
+    with open(path, 'rb') as f:
+        return io.BytesIO(f.read())
+
+def fetch_shapefile(path, localdir):
+    '''
+    Copies a shapefile and its sidecar files to a local folder.
+    :param path: The s3 or local path of the .shp file.
+    :param localdir: The local folder.
+    :return: The local path of the .shp file.
+    '''
+    stem = path[:-len('.shp')]
+    for extension in SHAPEFILE_EXTENSIONS:
+        local_path = os.path.join(localdir, os.path.basename(stem) + extension)
+        try:
+            if path.startswith('s3://'):
+                bucket, key = split_s3_path(stem + extension)
+                s3_client().download_file(bucket, key, local_path)
+            else:
+                shutil.copyfile(stem + extension, local_path)
+        except (ClientError, FileNotFoundError):
+            if extension in REQUIRED_EXTENSIONS:
+                raise
+    return os.path.join(localdir, os.path.basename(path))
+
+def thread_map(func, items, workers=None):
+    '''
+
+    :param func: The function to apply.
+    :param items: The arguments, one per job.
+    :param workers: The number of threads, read from application.yaml if not given.
+    :return: A list of the results in the same order as items.
+    '''
+    items = list(items)
+    if not items:
+        return []
+    workers = min(workers or fetch_workers(), len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
+
+def read_objects(paths, parser, workers=None):
+    '''
+    Downloads and parses objects concurrently.
+    :param paths: The s3 or local paths of the objects.
+    :param parser: A function parsing a file-like buffer, e.g. lambda f: pd.read_csv(f, sep='|').
+    :param workers: The number of threads, read from application.yaml if not given.
+    :return: A list of the parsed objects in the same order as paths.
+    '''
+    return thread_map(lambda path: parser(fetch_object(path)), paths, workers)
+
+def read_shapefiles(paths, parser, workers=None):
+    '''
+    Downloads and parses shapefiles concurrently, each one in its own temporary folder removed once parsed.
+    :param paths: The s3 or local paths of the .shp files.
+    :param parser: A function parsing the local path of a .shp file, e.g. gpd.read_file.
+    :param workers: The number of threads, read from application.yaml if not given.
+    :return: A list of the parsed shapefiles in the same order as paths.
+    '''
+    def read_shapefile(path):
+        with tempfile.TemporaryDirectory() as localdir:
+            return parser(fetch_shapefile(path, localdir))
+
+    return thread_map(read_shapefile, paths, workers)
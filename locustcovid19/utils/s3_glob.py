@@ -1,15 +1,11 @@
-import boto3
-client = boto3.client('s3')
+from utils.s3_list import s3_objects
 
 def s3_glob(bucket, prefix, pattern):
-     
-    resp = client.list_objects_v2(Bucket=bucket[5:], Prefix=prefix)
-    keys = []
-    all_files = []
-    for obj in resp['Contents']:
-        keys.append(obj['Key'])
-    for i in keys:
-        if pattern in i:
-           s = bucket + '/' + str(i)
-           all_files.append(s)
-    return all_files
+    '''
+
+    :param bucket: The bucket as an s3 path, e.g. 's3://mercy-locust-covid19-landing'.
+    :param prefix: The prefix of the keys, e.g. 'vegetation'.
+    :param pattern: A substring, a glob pattern or a compiled regex of the keys, see utils.s3_list.key_matches.
+    :return: The s3 paths of all matching objects, sorted by key.
+    '''
+    return [obj['path'] for obj in s3_objects(bucket, prefix, pattern)]
@@ -1,16 +1,18 @@
-import boto3
-client = boto3.client('s3')
+from utils.s3_list import s3_objects
 
-def s3_latest(bucket, prefix, pattern):
-     
-    resp = client.list_objects_v2(Bucket=bucket[5:], Prefix=prefix)
-    keys = []
-    all_files = []
-    for obj in resp['Contents']:
-        keys.append(obj['Key'])
-    for i in keys:
-        if pattern in i:
-           s = bucket + '/' + str(i)
-           all_files.append(s)
-    all_files.sort(reverse=True)
-    return all_files[0]
+def s3_latest(bucket, prefix, pattern, period=None):
+    '''
+
+    :param bucket: The bucket as an s3 path, e.g. 's3://mercy-locust-covid19-landing'.
+    :param prefix: The prefix of the keys, e.g. 'vegetation'.
+    :param pattern: A substring, a glob pattern or a compiled regex of the keys, see utils.s3_list.key_matches.
+    :param period: A function returning the period of a path, e.g. vegetation_index.file_period. The latest file is
+    the last modified one if not given.
+    :return: The s3 path of the latest matching object.
+    '''
+    objects = s3_objects(bucket, prefix, pattern)
+    if not objects:
+        raise FileNotFoundError('No object matching ' + str(pattern) + ' in ' + bucket + '/' + prefix)
+    if period is None:
+        return max(objects, key=lambda obj: obj['last_modified'])['path']
+    return max(objects, key=lambda obj: period(obj['path']))['path']
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to list the objects of the s3 buckets for s3_glob, s3_latest and the famine files.
+list_objects_v2 returns at most 1000 keys per call, so the listings go through the boto3 paginator, filtered on the
+server side by prefix. Each listing is kept in memory for s3.listing_ttl seconds (300 by default) so that the tables
+of a run do not list the same prefix again.
+"""
+
+import re
+import time
+import fnmatch
+from utils.config import get_setting
+from utils.s3_client import s3_client
+
+LISTING_TTL = 300
+
+_listings = {}
+
+def listing_ttl():
+    '''
+
+    :return: The number of seconds a listing is reused, 0 to list on every call.
+    '''
+    return float(get_setting('s3', 'listing_ttl', LISTING_TTL))
+
+def list_prefix(bucket, prefix):
+    '''
+    Lists all objects under a prefix, following the continuation tokens.
+    :param bucket: The bucket as an s3 path, e.g. 's3://mercy-locust-covid19-landing'.
+    :param prefix: The prefix of the keys, e.g. 'vegetation'.
+    :return: A list of dicts with the path, key, size, ETag and LastModified of each object, sorted by key.
+    '''
+    objects = []
+    paginator = s3_client().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket[5:], Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects.append({'path': bucket + '/' + obj['Key'], 'key': obj['Key'], 'size': obj['Size'],
+                            'etag': obj['ETag'].strip('"'), 'last_modified': obj['LastModified']})
+    return objects
+
+def cached_listing(bucket, prefix):
+    '''
+
+    :return: The objects under the prefix, listed again only if the listing in memory is older than the TTL.
+    '''
+    now = time.monotonic()
+    listed = _listings.get((bucket, prefix))
+    if listed is None or now - listed[0] > listing_ttl():
+        listed = (now, list_prefix(bucket, prefix))
+        _listings[(bucket, prefix)] = listed
+    return listed[1]
+
+def clear_listings(path=None):
+    '''
+    Forgets the listings in memory, e.g. after writing to a listed prefix.
+    :param path: The s3 or local path of a written object, only the listings of the prefixes it falls under are
+    forgotten. All listings if not given.
+    '''
+    if path is None:
+        _listings.clear()
+        return
+    for bucket, prefix in list(_listings):
+        if path.startswith(bucket + '/' + prefix):
+            _listings.pop((bucket, prefix), None)
+
+def key_matches(key, pattern):
+    '''
+
+    :param key: The key of an object.
+    :param pattern: A compiled regex searched in the key, a glob pattern matched against the whole key if it has a
+    * ? or [ wildcard, or otherwise a substring of the key.
+    :return: True if the key matches the pattern.
+    '''
+    if pattern is None:
+        return True
+    if isinstance(pattern, re.Pattern):
+        return pattern.search(key) is not None
+    if any(char in pattern for char in '*?['):
+        return fnmatch.fnmatchcase(key, pattern)
+    return pattern in key
+
+def s3_objects(bucket, prefix, pattern=None):
+    '''
+
+    :param bucket: The bucket as an s3 path.
+    :param prefix: The prefix of the keys, filtered by s3.
+    :param pattern: See key_matches, all objects under the prefix if not given.
+    :return: The dicts of the matching objects, see list_prefix.
+    '''
+    return [obj for obj in cached_listing(bucket, prefix) if key_matches(obj['key'], pattern)]
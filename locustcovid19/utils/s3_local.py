@@ -1,12 +1,11 @@
-import boto3
-client = boto3.client('s3')
+from utils.s3_client import s3_client
 
 def s3_local(bucket, prefix, localdir):
   
     print(bucket)
     print(prefix)
     print(localdir)
-    client.download_file(bucket[5:], prefix, localdir + prefix)
+    s3_client().download_file(bucket[5:], prefix, localdir + prefix)
 
     localpath_in = localdir + prefix 
     print(localpath_in)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to parse each raw csv or excel input of the landing bucket only once. The first time an
+object is read, the parsed dataframe is stored as a parquet copy keyed by the path and ETag of the object and the
+options of the reader. Later runs read the typed parquet copy instead, until the object changes in the bucket.
+The copies are kept in the staging folder of the reporting bucket, as every run starts on a new EC2 instance whose
+local disk is thrown away, or in the local cache folder if no reporting bucket is configured.
+"""
+
+import os
+import pandas as pd
+import pyarrow as pa
+from utils.config import cache_dir, get_setting
+from utils.geocache import hash_key, read_cached, write_cached
+from utils.s3_etag import s3_etag
+
+def staging_dir():
+    '''
+
+    :return: The folder of the parquet copies, ending with '/'.
+    '''
+    reporting = get_setting('data', 'reporting')
+    if reporting:
+        return reporting.rstrip('/') + '/staging/'
+    return cache_dir('staging')
+
+def staged_frame(path, reader, options):
+    '''
+    Reads a raw input from its parquet copy, or parses it and stores the copy.
+    :param path: The s3 or local path of the raw object.
+    :param reader: The function parsing the object, e.g. pd.read_csv.
+    :param options: The keyword arguments of the reader, part of the key of the copy.
+    :return: The dataframe.
+    '''
+    tags = [path, s3_etag(path), reader.__name__] + [key + '=' + repr(options[key]) for key in sorted(options)]
+    stage_path = staging_dir() + os.path.basename(path).rsplit('.', 1)[0] + '_' + hash_key(tags) + '.parquet'
+    df = read_cached(stage_path, lambda f: pd.read_parquet(f, engine='pyarrow'))
+    if df is not None:
+        return df
+
+    print("... staging " + path)
+    df = reader(path, **options)
+
+    try:
+        write_cached(stage_path, lambda f: df.to_parquet(f, engine='pyarrow', index=False))
+    except (ValueError, pa.ArrowException) as error:
+        # e.g. columns mixing numbers and text, the object is parsed again on every run
+        print("... " + path + " could not be staged: " + str(error))
+    return df
+
+def read_csv_staged(path, **options):
+    '''
+
+    :param path: The s3 or local path of the csv.
+    :param options: The arguments of pd.read_csv, e.g. sep.
+    :return: The dataframe, as pd.read_csv(path, **options) returns it.
+    '''
+    return staged_frame(path, pd.read_csv, options)
+
+def read_excel_staged(path, **options):
+    '''
+
+    :param path: The s3 or local path of the workbook.
+    :param options: The arguments of pd.read_excel, e.g. sheet_name.
+    :return: The dataframe, as pd.read_excel(path, **options) returns it.
+    '''
+    return staged_frame(path, pd.read_excel, options)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to calculate zonal statistics over rasters split in tiles.
+Every raster tile is indexed by its footprint, so each polygon is only sent to the tiles it intersects. Each polygon is
+rasterized once inside its own window of the tile and the categorical pixel counts are done with numpy.
+"""
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window
+from shapely.geometry import box
+from utils.parallel import parallel_map
+
+CROPLAND_VALUES = {"N00E50": 1} # pixel value of croplands per GFSAD tile, 2 for the tiles not listed
+
+_footprints = {}
+
+def cropland_value(tile):
+    '''
+
+    :param tile: The name of a GFSAD cropland geotiff tile, e.g. N00E50.
+    :return: The pixel value of the croplands in the tile.
+    '''
+    return CROPLAND_VALUES.get(tile, 2)
+
+def raster_footprint(raster_path):
+    '''
+    Reads the bounds of a raster once per process. The footprints are the index used to send each polygon only to
+    the tiles it intersects.
+    :param raster_path: The path of the geotiff.
+    :return: A polygon with the bounds of the raster in its own CRS.
+    '''
+    if raster_path not in _footprints:
+        with rasterio.open(raster_path) as src:
+            _footprints[raster_path] = box(*src.bounds)
+    return _footprints[raster_path]
+
+def polygons_in_tile(gdf, footprint):
+    '''
+
+    :param gdf: The polygons.
+    :param footprint: The footprint of the tile.
+    :return: The positions of the polygons of gdf that intersect the tile.
+    '''
+    candidates = gdf.sindex.query(footprint, predicate='intersects')
+    return np.sort(candidates)
+
+def polygon_window(src, geom):
+    '''
+
+    :param src: An open rasterio dataset.
+    :param geom: The polygon, in the CRS of the dataset.
+    :return: The window of the dataset covering the bounds of the polygon, or None if they do not overlap.
+    '''
+    minx, miny, maxx, maxy = geom.bounds
+    row_start, col_start = src.index(minx, maxy)
+    row_stop, col_stop = src.index(maxx, miny)
+    row_start, col_start = max(row_start, 0), max(col_start, 0)
+    row_stop, col_stop = min(row_stop + 1, src.height), min(col_stop + 1, src.width)
+    if row_start >= row_stop or col_start >= col_stop:
+        return None
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+def polygon_mask(src, geom):
+    '''
+    Rasterizes a polygon inside its own window, marking the pixels whose centre falls inside it (same rule as
+    rasterstats).
+    :param src: An open rasterio dataset.
+    :param geom: The polygon, in the CRS of the dataset.
+    :return: The window and a boolean array of the pixels of the window inside the polygon, or None if they do not
+    overlap. It can be reused for all rasters on the same grid.
+    '''
+    window = polygon_window(src, geom)
+    if window is None:
+        return None
+    inside = rasterize([(geom, 1)], out_shape=(int(window.height), int(window.width)),
+                       transform=src.window_transform(window), fill=0, dtype='uint8').astype(bool)
+    return window, inside
+
+def masked_pixels(src, mask):
+    '''
+
+    :param src: An open rasterio dataset.
+    :param mask: The mask of a polygon, see polygon_mask.
+    :return: A 1d array with the values of the valid pixels inside the polygon.
+    '''
+    if mask is None:
+        return np.array([], dtype=src.dtypes[0])
+    window, inside = mask
+    data = src.read(1, window=window, masked=True)
+    return data.data[inside & ~np.ma.getmaskarray(data)]
+
+def polygon_pixels(src, geom):
+    '''
+    Reads the valid pixels whose centre falls inside the polygon (same rule as rasterstats).
+    :param src: An open rasterio dataset.
+    :param geom: The polygon, in the CRS of the dataset.
+    :return: A 1d array with the values of the pixels.
+    '''
+    return masked_pixels(src, polygon_mask(src, geom))
+
+def value_counts(values):
+    '''
+
+    :param values: A 1d array of categorical pixel values.
+    :return: A dict with the number of pixels per value.
+    '''
+    if values.size == 0:
+        return {}
+    if np.issubdtype(values.dtype, np.integer) and values.min() >= 0:
+        counts = np.bincount(values)
+        categories = np.flatnonzero(counts)
+        return dict(zip(categories.tolist(), counts[categories].tolist()))
+    categories, counts = np.unique(values, return_counts=True)
+    return dict(zip(categories.tolist(), counts.tolist()))
+
+def categorical_counts(geometries, raster_path):
+    '''
+    Counts the pixels of each category inside each polygon.
+    :param geometries: A geoseries with the polygons, in the CRS of the raster.
+    :param raster_path: The path of the geotiff.
+    :return: A df indexed like geometries with one column per pixel value and a 'count' column with all valid pixels.
+    Categories not found in a polygon are NaN, as in rasterstats.
+    '''
+    rows = []
+    with rasterio.open(raster_path) as src:
+        for geom in geometries:
+            counts = value_counts(polygon_pixels(src, geom))
+            counts['count'] = sum(counts.values())
+            rows.append(counts)
+    return pd.DataFrame(rows, index=geometries.index)
+
+def tile_job(job):
+    '''
+    Counts the pixels of one category for the polygons of a tile. Runs in the worker processes, each opening its own
+    dataset.
+    :param job: A tuple with the polygons, the path of the geotiff and the pixel value to count.
+    :return: A df indexed like the polygons with two columns: category_count (NaN if not found) and area_count.
+    '''
+    geometries, raster_path, category = job
+    stats = categorical_counts(geometries, raster_path).reindex(columns=[category, 'count'])
+    return stats.rename(columns={category: 'category_count', 'count': 'area_count'})
+
+def tiles_counts(gdf, raster_paths, categories, workers=None):
+    '''
+    Counts the pixels of one category per tile for the polygons that intersect each tile.
+    :param gdf: The polygons, in the CRS of the tiles.
+    :param raster_paths: A dict with the tile name as key and the path of the geotiff as value.
+    :param categories: A dict with the tile name as key and the pixel value to count as value.
+    :param workers: The number of processes, read from application.yaml if not given.
+    :return: A dict with the tile name as key and a df indexed like gdf as value, see tile_job.
+    '''
+    tiles = list(raster_paths)
+    jobs = []
+    for tile in tiles:
+        positions = polygons_in_tile(gdf, raster_footprint(raster_paths[tile]))
+        print("... tile " + tile + " intersects " + str(len(positions)) + " polygons.")
+        jobs.append((gdf.geometry.iloc[positions], raster_paths[tile], categories[tile]))
+
+    return dict(zip(tiles, parallel_map(tile_job, jobs, workers)))
+
+def tile_counts(gdf, tile, raster_path, category):
+    '''
+    Counts the pixels of one category for the polygons that intersect a tile.
+    :param gdf: The polygons, in the CRS of the tile.
+    :param tile: The name of the tile.
+    :param raster_path: The path of the geotiff.
+    :param category: The pixel value to count.
+    :return: A df indexed like gdf with two columns: category_count (NaN if not found) and area_count.
+    '''
+    return tiles_counts(gdf, {tile: raster_path}, {tile: category}, workers=1)[tile]
+
+def merge_tiles(counts, keys):
+    '''
+    Adds up the counts of the polygons that are split between several tiles.
+    :param counts: A df with the counts of all tiles, one row per polygon and tile.
+    :param keys: The columns identifying a polygon, all other columns are summed.
+    :return: A df with one row per polygon, sorted by keys. A count stays NaN when it is NaN in all tiles.
+    '''
+    return counts.groupby(keys, sort=True).sum(min_count=1).reset_index()
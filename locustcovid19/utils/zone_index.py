@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+The aim of this module is to calculate zonal statistics of non overlapping polygons, e.g. the districts, with a zone
+index: a label raster on the grid of the data raster where each pixel holds the position + 1 of the polygon its centre
+falls in (0 outside all polygons). The label raster is burnt once per grid, keyed by the CRS, transform and shape of the
+grid and by the version of the polygons, and cached on disk as a tiled and compressed GeoTIFF. Every statistic is
+then one np.bincount of the labels per block of the rasters, without any polygon being rasterized again. For rasters
+split in tiles, the label raster of a tile only covers the window of the districts that intersect it.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import rasterize
+from rasterio import windows
+from rasterio.windows import Window
+from shapely.geometry import box
+from utils.config import cache_dir, temp_path
+from utils.geocache import hash_key
+from utils.boundaries import get_boundaries, cache_key as boundaries_key
+from utils.zonal import polygons_in_tile, polygon_window, raster_footprint
+from utils.parallel import parallel_map
+
+ZONE_BLOCK_SIZE = 512
+
+def grid_tags(crs, transform, width, height):
+    '''
+
+    :return: The CRS, transform and shape of a grid as strings.
+    '''
+    return [str(crs), str(tuple(transform)), str(width), str(height)]
+
+def zone_dtype(n_zones):
+    '''
+
+    :param n_zones: The number of polygons.
+    :return: The smallest integer dtype for the labels.
+    '''
+    return 'int16' if n_zones < np.iinfo('int16').max else 'int32'
+
+def grid_windows(width, height):
+    '''
+
+    :return: The windows of ZONE_BLOCK_SIZE pixels covering a grid, aligned with the tiles of the label raster.
+    '''
+    for row in range(0, height, ZONE_BLOCK_SIZE):
+        for col in range(0, width, ZONE_BLOCK_SIZE):
+            yield Window(col, row, min(ZONE_BLOCK_SIZE, width - col), min(ZONE_BLOCK_SIZE, height - row))
+
+def burn_zones(geometries, crs, transform, width, height, zones_path):
+    '''
+    Writes the label raster block by block, rasterizing in each block only the polygons that intersect it.
+    :param geometries: A geoseries with the polygons, in the CRS of the grid.
+    :param crs: The CRS of the grid.
+    :param transform: The affine transform of the grid.
+    :param width: The number of columns of the grid.
+    :param height: The number of rows of the grid.
+    :param zones_path: The path of the label raster.
+    '''
+    geometries = geometries.reset_index(drop=True)
+    dtype = zone_dtype(len(geometries))
+    profile = {'driver': 'GTiff', 'dtype': dtype, 'count': 1, 'width': width, 'height': height,
+               'crs': crs, 'transform': transform, 'nodata': 0, 'compress': 'lzw', 'tiled': True,
+               'blockxsize': ZONE_BLOCK_SIZE, 'blockysize': ZONE_BLOCK_SIZE}
+
+    with rasterio.open(zones_path, 'w', **profile) as zones:
+        for window in grid_windows(width, height):
+            positions = geometries.sindex.query(box(*windows.bounds(window, transform)), predicate='intersects')
+            out_shape = (int(window.height), int(window.width))
+            if len(positions) == 0:
+                labels = np.zeros(out_shape, dtype=dtype)
+            else:
+                shapes = [(geometries.iloc[position], int(position) + 1) for position in np.sort(positions)]
+                labels = rasterize(shapes, out_shape=out_shape, transform=windows.transform(window, transform),
+                                   fill=0, dtype=dtype)
+            zones.write(labels, 1, window=window)
+
+def zone_index(geometries, raster_path, name, key, window=None):
+    '''
+    Returns the label raster of the polygons on the grid of a raster, burning it only if it is not cached yet.
+    :param geometries: A geoseries with non overlapping polygons, in the CRS of the raster.
+    :param raster_path: The path of a geotiff on the grid.
+    :param name: The name of the polygons, e.g. 'districts'.
+    :param key: A hash of the version of the polygons, e.g. utils.boundaries.cache_key.
+    :param window: A window of the raster covering the polygons, the label raster is only burnt on this part of the grid
+    if given, see zone_blocks.
+    :return: The path of the cached label raster.
+    '''
+    with rasterio.open(raster_path) as src:
+        if window is None:
+            window = Window(0, 0, src.width, src.height)
+        grid = (src.crs, src.window_transform(window), int(window.width), int(window.height))
+        zones_path = cache_dir('zones') + name + '_' + hash_key(grid_tags(*grid) + [key, str(len(geometries))]) + '.tif'
+        if not os.path.exists(zones_path):
+            print("... burning the zone index of " + name + " for " + raster_path)
+            # Write to a temporary file first so that concurrent runs never read a half written label raster
+            tmp_path = temp_path(zones_path, '.tif')
+            try:
+                burn_zones(geometries, *grid, tmp_path)
+                os.replace(tmp_path, zones_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    return zones_path
+
+def district_zones(path_in, raster_path):
+    '''
+
+    :param path_in: The landing path where the Spatial folder is.
+    :param raster_path: The path of a geotiff on the grid.
+    :return: The path of the label raster of all districts (hierarchy 2), labelled in the order of get_boundaries.
+    '''
+    return zone_index(get_boundaries(path_in, 2).geometry, raster_path, 'districts', boundaries_key(path_in, 2))
+
+def zone_blocks(zones_path, raster_path, window=None):
+    '''
+    Reads the label raster and the data raster block by block.
+    :param window: The window of the data raster the label raster was burnt on, the whole raster if not given.
+    :return: For each block, the labels and the values of the valid pixels inside a polygon, as 1d arrays.
+    '''
+    col_off, row_off = (int(window.col_off), int(window.row_off)) if window is not None else (0, 0)
+    with rasterio.open(zones_path) as zones, rasterio.open(raster_path) as src:
+        for _, block in zones.block_windows(1):
+            labels = zones.read(1, window=block)
+            data = src.read(1, window=Window(block.col_off + col_off, block.row_off + row_off, block.width,
+                                             block.height), masked=True)
+            valid = (labels > 0) & ~np.ma.getmaskarray(data)
+            yield labels[valid], data.data[valid]
+
+def zonal_sums(zones_path, raster_path, n_zones, valid_min=None, valid_max=None):
+    '''
+    Adds up the valid pixels of each polygon.
+    :param zones_path: The label raster, see zone_index.
+    :param raster_path: The path of the geotiff on the same grid.
+    :param n_zones: The number of polygons.
+    :param valid_min: The lowest valid pixel value, e.g. to derive the mean of a normalisation of the raster.
+    :param valid_max: The highest valid pixel value.
+    :return: A df with one row per polygon in order and two columns: the sum (NaN if no valid pixel, as in
+    rasterstats) and the count of the valid pixels.
+    '''
+    sums = np.zeros(n_zones + 1)
+    counts = np.zeros(n_zones + 1, dtype=np.int64)
+    for labels, values in zone_blocks(zones_path, raster_path):
+        if valid_min is not None or valid_max is not None:
+            in_range = np.ones(values.shape, dtype=bool)
+            if valid_min is not None:
+                in_range &= values >= valid_min
+            if valid_max is not None:
+                in_range &= values <= valid_max
+            labels, values = labels[in_range], values[in_range]
+        sums += np.bincount(labels, weights=values, minlength=n_zones + 1)
+        counts += np.bincount(labels, minlength=n_zones + 1)
+
+    stats = pd.DataFrame({'sum': sums[1:], 'count': counts[1:]})
+    stats.loc[stats['count'] == 0, 'sum'] = np.nan
+    return stats
+
+def zonal_sums_stack(zones_path, raster_paths, n_zones):
+    '''
+    Adds up the valid pixels of each polygon for several rasters on the same grid, reading the labels only once.
+    :param zones_path: The label raster, see zone_index.
+    :param raster_paths: A dict with a name as key and the path of a geotiff on the grid of the labels as value.
+    :param n_zones: The number of polygons.
+    :return: A df with one row per polygon in order and one column with the sums per raster (NaN if no valid pixel).
+    '''
+    sums = {name: np.zeros(n_zones + 1) for name in raster_paths}
+    counts = {name: np.zeros(n_zones + 1, dtype=np.int64) for name in raster_paths}
+    sources = {name: rasterio.open(path) for name, path in raster_paths.items()}
+    try:
+        with rasterio.open(zones_path) as zones:
+            for _, window in zones.block_windows(1):
+                labels = zones.read(1, window=window)
+                inside = labels > 0
+                for name, src in sources.items():
+                    data = src.read(1, window=window, masked=True)
+                    valid = inside & ~np.ma.getmaskarray(data)
+                    sums[name] += np.bincount(labels[valid], weights=data.data[valid], minlength=n_zones + 1)
+                    counts[name] += np.bincount(labels[valid], minlength=n_zones + 1)
+    finally:
+        for src in sources.values():
+            src.close()
+
+    return pd.DataFrame({name: np.where(counts[name][1:] > 0, sums[name][1:], np.nan) for name in raster_paths})
+
+def district_sums(path_in, raster_paths):
+    '''
+    Adds up the valid pixels of each district for several rasters, in one pass per grid.
+    :param path_in: The landing path where the Spatial folder is.
+    :param raster_paths: A dict with a name as key, e.g. the year, and the path of a geotiff as value.
+    :return: A df indexed like get_boundaries with one column with the sums per raster.
+    '''
+    n_zones = len(get_boundaries(path_in, 2))
+    grids = {}
+    for name, raster_path in raster_paths.items():
+        grids.setdefault(district_zones(path_in, raster_path), {})[name] = raster_path
+
+    stats = pd.concat([zonal_sums_stack(zones_path, paths, n_zones) for zones_path, paths in grids.items()], axis=1)
+    return stats[list(raster_paths)]
+
+def zonal_categorical_counts(zones_path, raster_path, n_zones, categories, window=None):
+    '''
+    Counts the pixels of some categories in each polygon.
+    :param zones_path: The label raster, see zone_index.
+    :param raster_path: The path of the geotiff on the same grid.
+    :param n_zones: The number of polygons.
+    :param categories: The pixel values to count.
+    :param window: The window of the geotiff the label raster was burnt on, the whole geotiff if not given.
+    :return: A df with one row per polygon in order, one column per category and a 'count' column with all valid
+    pixels. Categories not found in a polygon are NaN, as in rasterstats.
+    '''
+    counts = {category: np.zeros(n_zones + 1, dtype=np.int64) for category in categories}
+    total = np.zeros(n_zones + 1, dtype=np.int64)
+    for labels, values in zone_blocks(zones_path, raster_path, window):
+        total += np.bincount(labels, minlength=n_zones + 1)
+        for category in categories:
+            counts[category] += np.bincount(labels[values == category], minlength=n_zones + 1)
+
+    stats = pd.DataFrame({category: counts[category][1:] for category in categories})
+    stats = stats.where(stats > 0)
+    stats['count'] = total[1:]
+    return stats
+
+def district_counts_job(job):
+    '''
+    Counts the pixels of one category per district on a raster tile. Runs in the worker processes. Only the districts
+    that intersect the tile are burnt, on the window of the tile covering their bounds, and only this window is read.
+    :param job: A tuple with the landing path, the path of the geotiff and the pixel value to count.
+    :return: A df with the districts that intersect the tile, indexed like get_boundaries, with two columns:
+    category_count (NaN if not found) and area_count.
+    '''
+    path_in, raster_path, category = job
+    gdf_districts = get_boundaries(path_in, 2)
+    positions = polygons_in_tile(gdf_districts, raster_footprint(raster_path))
+    geometries = gdf_districts.geometry.iloc[positions]
+
+    window = None
+    if len(positions) > 0:
+        with rasterio.open(raster_path) as src:
+            window = polygon_window(src, box(*geometries.total_bounds))
+    if window is None:
+        # The districts only touch the border of the tile
+        return pd.DataFrame({'category_count': np.nan, 'area_count': 0}, index=positions)
+
+    zones_path = zone_index(geometries, raster_path, 'districts', boundaries_key(path_in, 2), window)
+    stats = zonal_categorical_counts(zones_path, raster_path, len(positions), [category], window)
+    stats.index = positions
+    return stats.rename(columns={category: 'category_count', 'count': 'area_count'})
+
+def tiles_district_counts(path_in, raster_paths, categories, workers=None):
+    '''
+    Counts the pixels of one category per district for rasters split in tiles, with one zone index per tile.
+    :param path_in: The landing path where the Spatial folder is.
+    :param raster_paths: A dict with the tile name as key and the path of the geotiff as value.
+    :param categories: A dict with the tile name as key and the pixel value to count as value.
+    :param workers: The number of processes, read from application.yaml if not given.
+    :return: A dict with the tile name as key and as value a df with the districts that intersect the tile, indexed
+    like get_boundaries, see district_counts_job.
+    '''
+    tiles = list(raster_paths)
+    jobs = [(path_in, raster_paths[tile], categories[tile]) for tile in tiles]
+
+    stats = {}
+    for tile, counts in zip(tiles, parallel_map(district_counts_job, jobs, workers)):
+        print("... tile " + tile + " intersects " + str(len(counts)) + " districts.")
+        stats[tile] = counts
+    return stats
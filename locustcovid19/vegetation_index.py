@@ -14,48 +14,127 @@ import geopandas as gpd
 import rasterio
 from rasterio.mask import mask
 from utils.flat_files import FlatFiles
+from utils.boundaries import get_boundaries
 from rasterstats import zonal_stats
-from utils.s3_local import s3_local
+from utils.zone_index import district_zones, zonal_sums
+from utils.parallel import parallel_map
 from utils.s3_latest import s3_latest
+from utils.s3_glob import s3_glob
+from utils.s3_list import clear_listings
 from utils.removefile import removefile
 import numpy as np
-import copy
 import os
 import re
 import yaml
 
-COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
+NDVI_MIN = 100
+NDVI_MAX = 200
+OUT_BLOCK_SIZE = 256
+EMODIS_FILES = re.compile(r'vegetation/ea\d+\.tif$')
+
+def normalise_ndvi(ndvi):
+    '''
+    Values < 100 and > 200 are set to nan and the rest normalised:
+    x normalized = (x – x minimum) / (x maximum – x minimum)
+    :param ndvi: An array with the raw NDVI values of a block.
+    :return: A float32 array with the normalised values.
+    '''
+    return np.where((ndvi >= NDVI_MIN) & (ndvi <= NDVI_MAX),
+                    (ndvi.astype('float32') - NDVI_MIN) / np.float32(NDVI_MAX - NDVI_MIN), np.float32(np.nan))
+
+def file_period(filepath):
+    '''
+
+    :param filepath: The path of an eMODIS file, e.g. .../vegetation/ea2012.tif
+    :return: The period in the name of the file, e.g. '2012' for the 12th dekad of 2020.
+    '''
+    return str(re.findall('\d+', filepath.split('/')[-1])[0])
+
+def vegetation_files(path_in):
+    '''
+
+    :return: A dict with the period as key and the path of the eMODIS file as value, for all files in the landing bucket.
+    '''
+    return {file_period(f): f for f in s3_glob(path_in, 'vegetation', EMODIS_FILES)}
+
+def processed_periods(path_out):
+    '''
+
+    :return: The periods already exported to the vegetation_fact folder of the reporting bucket.
+    '''
+    all_files = s3_glob(path_out, 'vegetation_fact', 'vegetation_fact/vegetation_table_')
+    return {file_period(f) for f in all_files if f.endswith('.parquet')}
+
+def missing_periods(path_in, path_out, start=None, end=None):
+    '''
+
+    :param start: The first period to process, e.g. '2001', all periods if not given.
+    :param end: The last period to process, e.g. '2036', all periods if not given.
+    :return: A dict with the period as key and the path of the eMODIS file as value, for the periods in the range that
+    have no vegetation table yet.
+    '''
+    done = processed_periods(path_out)
+    return {period: f for period, f in sorted(vegetation_files(path_in).items())
+            if period not in done and (start is None or period >= str(start)) and (end is None or period <= str(end))}
+
+def process_period(job):
+    '''
+    Exports the vegetation table of one period. Runs in the worker processes.
+    :param job: A tuple with the landing and reporting paths and the path of the eMODIS file.
+    :return: The period.
+    '''
+    path_in, path_out, filepath = job
+    table = VegetationTable(path_in, path_out, filepath)
+    table.export_table()
+    return table.period
+
+def backfill(path_in, path_out, start=None, end=None, workers=None):
+    '''
+    Exports the vegetation tables of all periods in the range that were not processed yet, in a pool of processes.
+    All eMODIS files are on the same grid, so the zone index of the districts is burnt once and shared by all periods.
+    :param start: The first period to process, all periods if not given.
+    :param end: The last period to process, all periods if not given.
+    :param workers: The number of processes, read from application.yaml if not given.
+    :return: The periods processed.
+    '''
+    files = missing_periods(path_in, path_out, start, end)
+    print("... " + str(len(files)) + " periods to process: " + ', '.join(files))
+    if not files:
+        return []
+
+    district_zones(path_in, next(iter(files.values())))
+
+    jobs = [(path_in, path_out, f) for f in files.values()]
+    return parallel_map(process_period, jobs, workers)
 
 class VegetationTable:
     '''
     This class calculates the avg NDVI vegetation index per district for a given date.
     '''
-    def __init__(self, path_in, path_out):
+    def __init__(self, path_in, path_out, filepath=None):
+        '''
+
+        :param filepath: The eMODIS file to process, the latest one if not given.
+        '''
         self.path_in = path_in
         self.path_out = path_out
         self.flats = FlatFiles(self.path_in, self.path_out)
         self.localdir = '/home/ec2-user/Locust-Covid19/'
-          
-        try:
-           os.makedirs(self.localdir + 'vegetation')
-           print("Directory created ")
-        except FileExistsError:
-           print("Directory already exists")
-
 
-        filepath = s3_latest(self.path_in, 'vegetation', 'ea')
+        if filepath is None:
+            filepath = s3_latest(self.path_in, 'vegetation', EMODIS_FILES, file_period)
         print("filepath")
         print(filepath)
         filename = filepath.split('/')[-1]
         self.filename = filename
         print(filename)
-        self.period = str(re.findall('\d+', filename)[0])
+        self.period = file_period(filepath)
         print('period')
         print(self.period)
         newname = filename.replace('.tif', '_out.tif')
         print(newname)
-        # NDVI raster path
-        self.raster_path = s3_local(self.path_in, 'vegetation/' + filename, self.localdir)
+        # NDVI raster path, read directly from S3
+        self.raster_path = filepath
         self.raster_path_out = self.localdir + 'vegetation/' + newname
 
     def clip_raster(self):
@@ -64,7 +143,7 @@ class VegetationTable:
         :return: A clipped raster
         '''
         # Load merged countries' boundaries
-        countries = self.get_all_countries(1)
+        countries = get_boundaries(self.path_in, 1)
         #rdf = gpd.GeoDataFrame(pd.concat(dataframesList, ignore_index=True))
 
         data = rasterio.open(self.raster_path)
@@ -92,83 +171,45 @@ class VegetationTable:
             dest.write(out_img)
 
     def filter_n_norm_raster(self):
-        # Filter raster
-        print('Starts filter_n')
-        with rasterio.open(self.raster_path, 'r+') as raster:
-            print("... filtering and normalising raster.")
-            ndvi = raster.read()  # read all raster values
-            # transform values < 100 and > 200 to nan
-            ndvi_filtered = copy.copy(ndvi)
-            ndvi_filtered[ndvi < 100] = 0.0
-            ndvi_filtered[ndvi > 200] = 0.0
-            ndvi_filtered = ndvi_filtered.astype('float32')
-            ndvi_filtered[ndvi_filtered == 0.0] = np.nan
-
-            # normalise values
-            # x normalized = (x – x minimum) / (x maximum – x minimum)
-            ndvi_normed = (ndvi_filtered - 100) / (200 - 100)
-
-            # Replace nan with 0s
-            #ndvi_final = np.nan_to_num(ndvi_normed, copy=True, nan=0.0, posinf=None, neginf=None)
-            ndvi_final = ndvi_normed
-
-            # Save new raster
-            number_of_bands, height, width = ndvi_final.shape
-            raster_new = rasterio.open(self.raster_path_out, 'w',
-                                       driver='GTiff',
-                                       height=height,
-                                       width=width,
-                                       count = number_of_bands,
-                                       dtype = ndvi_final.dtype,
-                                       nodata=0,
-                                       crs=raster.crs,
-                                       transform=raster.transform,
-                                       compress='lzw')
-            raster_new.write(ndvi_final)
-            raster_new.close()
-
-    def read_boundaries_shp(self, country, hierarchy):
         '''
-
-        :param country: The reference country
-        :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
-        :return: A geodataframe with 2 columns: locationID and geometry.
-        '''
-        gdf_country = gpd.read_file(self.path_in + "/Spatial/gadm36_" + country + "_" + str(hierarchy) + ".shp")
-        GID_column = 'GID_' + str(hierarchy)
-        gdf_country = gdf_country[[GID_column, 'geometry']]
-        gdf_country = gdf_country.rename(columns={GID_column: 'locationID'})
-
-        return gdf_country
-
-    def get_all_countries(self, hierarchy):
-        '''
-
-        :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
-        :return: A geodataframe with all districts of the 6 countries concatenated.
+        Filters and normalises the raster block by block, following the tiles of the output GeoTIFF, so that only one
+        block is in memory at a time and each tile is written once. Writes a tiled and compressed float raster to
+        raster_path_out, with NaN as nodata as 0 is a valid normalised value.
         '''
+        print('Starts filter_n')
+        os.makedirs(self.localdir + 'vegetation', exist_ok=True)
+        with rasterio.open(self.raster_path) as raster:
+            print("... filtering and normalising raster.")
+            profile = raster.profile
+            profile.update(driver='GTiff', dtype='float32', nodata=np.nan, compress='lzw', tiled=True,
+                           blockxsize=OUT_BLOCK_SIZE, blockysize=OUT_BLOCK_SIZE)
 
-        gdf_countries = gpd.GeoDataFrame()
-        for country in COUNTRIES_IDS:
-            gdf_country = self.read_boundaries_shp(country, hierarchy)
-            gdf_countries = gdf_countries.append(gdf_country)
-        gdf_countries.crs = {"init": "epsg:4326"}
-        return gdf_countries
+            with rasterio.open(self.raster_path_out, 'w', **profile) as raster_new:
+                for _, window in raster_new.block_windows(1):
+                    raster_new.write(normalise_ndvi(raster.read(window=window)), window=window)
 
-    def get_stats(self):
+    def get_stats(self, direct=True):
         '''
-
-        :return: A df with two columns, district id and cropland area.
+        Calculates the average normalised NDVI per district.
+        :param direct: If True the means are derived from the sums and counts of the valid raw values, as the
+        normalisation is affine, without writing the normalised raster. If False the normalised raster is written to the
+        local disk first.
+        :return: A df with two columns, district id and average NDVI.
         '''
-        # Filter and normalise raster
-        print("Calls filter")
-        self.filter_n_norm_raster()
-
-        gdf_districts = self.get_all_countries(2)
+        gdf_districts = get_boundaries(self.path_in, 2).copy()
 
         print("... calculating zonal statistics.")
-        stats = zonal_stats(gdf_districts.geometry, self.raster_path_out,  layer="polygons", stats="mean") # Cross districts with normalised ndvi
-        gdf_districts['avg_ndvi'] = pd.DataFrame(stats)
+        if direct:
+            zones = district_zones(self.path_in, self.raster_path)
+            sums = zonal_sums(zones, self.raster_path, len(gdf_districts), NDVI_MIN, NDVI_MAX)
+            mean_ndvi = sums['sum'] / sums['count'].where(sums['count'] > 0)
+            gdf_districts['avg_ndvi'] = (mean_ndvi - NDVI_MIN) / (NDVI_MAX - NDVI_MIN)
+        else:
+            # Filter and normalise raster
+            print("Calls filter")
+            self.filter_n_norm_raster()
+            stats = zonal_stats(gdf_districts.geometry, self.raster_path_out,  layer="polygons", stats="mean") # Cross districts with normalised ndvi
+            gdf_districts['avg_ndvi'] = pd.DataFrame(stats)
         #Filter columns
         df_districts = gdf_districts[['locationID', 'avg_ndvi']]
 
@@ -228,7 +269,9 @@ class VegetationTable:
         :return: The Vegetation index table in a parquet format with the period added in its name.
         '''
         forageland_df = self.add_fact_ids()
-        self.flats.export_to_parquet(forageland_df, '/vegetation_fact/vegetation_table_' + self.period)
+        # One file per period, found by missing_periods, whatever facts.partitioned is
+        self.flats.export_fact_table(forageland_df, '/vegetation_fact/vegetation_table_' + self.period, partitions=[])
+        clear_listings(self.path_out + '/vegetation_fact/vegetation_table_' + self.period + '.parquet')
 
 
 if __name__ == '__main__':
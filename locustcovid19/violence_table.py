@@ -11,13 +11,14 @@ Created on Thu Sep 02 12:21:40 2020
 import os
 import pandas as pd
 import geopandas as gpd
-from utils.flat_files import FlatFiles
-from datetime import datetime
+from utils.flat_files import FlatFiles, date_key
+from utils.boundaries import get_boundaries
+from utils.csv_stream import read_csv_filtered
 from shapely.geometry import Point
 import time
 import yaml
 
-COUNTRIES_IDS = ["KEN", "SOM", "ETH", "UGA", "SSD", "SDN"]
+VIOLENCE_COLUMNS = ['event_date', 'latitude', 'longitude', 'fatalities', 'timestamp']
 
 class ViolenceTable:
     '''
@@ -27,8 +28,8 @@ class ViolenceTable:
         self.path_in = path_in
         self.path_out = path_out
         self.flats = FlatFiles(self.path_in, self.path_out)
-        self.violence = pd.read_csv(self.path_in + '/social_cohesion/violence/violence.csv', sep=',',
-                                    encoding='utf-8')[['event_date', 'latitude', 'longitude', 'fatalities', 'timestamp']]
+        self.violence = read_csv_filtered(self.path_in + '/social_cohesion/violence/violence.csv',
+                                          usecols=VIOLENCE_COLUMNS, sep=',', encoding='utf-8')[VIOLENCE_COLUMNS]
 
     def coord_to_geometry(self):
         violence_df = self.violence
@@ -44,41 +45,17 @@ class ViolenceTable:
 
         return violence_gdf
 
-    def read_boundaries_shp(self, country, hierarchy):
-        '''
-
-        :param country: The reference country
-        :param hierarchy: The boundaries level, 0 for countries, 1 for regions, 2 for districts.
-        :return: A geodataframe with 2 columns: locationID and geometry.
-        '''
-        gdf_country = gpd.read_file(self.path_in + "/Spatial/gadm36_" + country + "_" + str(hierarchy) + ".shp")
-        GID_column = 'GID_' + str(hierarchy)
-        gdf_country = gdf_country[[GID_column, 'geometry']]
-        gdf_country = gdf_country.rename(columns={GID_column: 'locationID'})
-
-        return gdf_country
-
-    def get_districts(self):
-        all_districts = gpd.GeoDataFrame()
-        for country in COUNTRIES_IDS:
-            gdf_district = self.read_boundaries_shp(country, 2)
-            all_districts = all_districts.append(gdf_district)
-        all_districts.crs = {"init": "epsg:4326"}
-
-        return all_districts
-
     def add_ids(self):
         violence = self.coord_to_geometry()
 
         # Spatial join with districts and add locationID
-        districts = self.get_districts()
+        districts = get_boundaries(self.path_in, 2)[['locationID', 'geometry']]
         violence = gpd.sjoin(districts, violence, how='right', op='contains')
 
         # Add dateID
         violence['date'] = pd.to_datetime(violence['event_date'])
-        violence['date'] = [d.date() for d in violence['date']]
-        violence['dateID'] = violence['date'].apply(lambda x: datetime.strftime(x, '%Y%m%d'))
-        violence['dateID'] = violence['dateID'].astype(int)
+        violence['dateID'] = date_key(violence['date'])
+        violence['date'] = violence['date'].dt.date
 
         # Add value & factID per table (occurencies and deaths)
         occurencies = violence.copy().reset_index(drop=True)
@@ -105,7 +82,7 @@ class ViolenceTable:
         violence_df = self.add_ids()
         #self.export_csv_w_date(violence_df, 'violence_table')
         #self.export_parquet_w_date(violence_df, 'violence_table')
-        self.flats.export_to_parquet(violence_df, '/violence_fact/violence_table')
+        self.flats.export_fact_table(violence_df, '/violence_fact/violence_table')
 
 if __name__ == '__main__':
 
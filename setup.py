@@ -32,7 +32,7 @@ with open('requirements.txt') as f:
 
 setup(
     name=project,
-    python_requires='>=3.7',
+    python_requires='>=3.9',
     version="1.0.0",   # use semantic versioning. See https://semver.org/ 
     description="template for python projects",
     long_description=read('README.md'),
@@ -1 +1,7 @@
-# this file can be empty but it is needed to tell python that "tests" is a package and will contain .py files
\ No newline at end of file
+# this file can be empty but it is needed to tell python that "tests" is a package and will contain .py files
+# the modules of locustcovid19 import each other as top level modules (from utils.x import y), as when run with
+# python3 locustcovid19, so its folder is added to the path of the tests
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'locustcovid19'))
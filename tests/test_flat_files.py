@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the fixed schema of the fact tables and of their hive partitioned export.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import utils.config
+from utils.flat_files import FlatFiles, fact_table, partition_values, ymd_key, date_key, HIVE_DEFAULT_PARTITION, \
+    DICTIONARY_STRING
+
+def fact_df():
+    return pd.DataFrame({'factID': ['F_0', 'F_1', 'F_2', 'F_3', 'F_4'],
+                         'measureID': [32.0, 32.0, np.nan, 33.0, 32.0],
+                         'dateID': [20200105, 20191231, 20200110, None, 20200301],
+                         'locationID': ['KEN.1.2_1', 'KEN.1.2_1', 'SOM.3.1_1', None, 'ETH.2.4_1'],
+                         'value': [1, 2, 3, 4, 5],
+                         'commodity_name': ['Maize', 'Maize', 'Sorghum', 'Maize', None]})
+
+class FactTableTest(unittest.TestCase):
+
+    def test_schema(self):
+        table = fact_table(fact_df())
+
+        self.assertEqual(table.schema.field('factID').type, pa.string())
+        self.assertEqual(table.schema.field('measureID').type, pa.int32())
+        self.assertEqual(table.schema.field('dateID').type, pa.int32())
+        self.assertEqual(table.schema.field('locationID').type, DICTIONARY_STRING)
+        self.assertEqual(table.schema.field('value').type, pa.float64())
+        self.assertEqual(table.schema.field('commodity_name').type, DICTIONARY_STRING)
+
+    def test_nulls(self):
+        table = fact_table(fact_df())
+
+        self.assertEqual(table.column('measureID').to_pylist(), [32, 32, None, 33, 32])
+        self.assertEqual(table.column('dateID').to_pylist(), [20200105, 20191231, 20200110, None, 20200301])
+        self.assertEqual(table.column('locationID').to_pylist(),
+                         ['KEN.1.2_1', 'KEN.1.2_1', 'SOM.3.1_1', None, 'ETH.2.4_1'])
+        self.assertEqual(table.column('commodity_name').null_count, 1)
+        self.assertEqual(table.column('value').to_pylist(), [1.0, 2.0, 3.0, 4.0, 5.0])
+
+    def test_date_keys(self):
+        keys = ymd_key(pd.Series(['2020', None, 2019]), pd.Series([3, 1, 12]))
+        self.assertEqual(str(keys.dtype), 'Int32')
+        self.assertEqual(keys.tolist(), [20200301, pd.NA, 20191201])
+
+        keys = date_key(pd.Series(['2020-02-29', None]))
+        self.assertEqual(str(keys.dtype), 'Int32')
+        self.assertEqual(keys.tolist(), [20200229, pd.NA])
+
+    def test_add_date_id(self):
+        df = FlatFiles('', '').add_date_id(pd.DataFrame({'year': ['2014', '2020']}), 'year')
+        self.assertEqual(df['year'].tolist(), [pd.Timestamp(2014, 1, 1), pd.Timestamp(2020, 1, 1)])
+        self.assertEqual(str(df['dateID'].dtype), 'Int32')
+        self.assertEqual(df['dateID'].tolist(), [20140101, 20200101])
+
+    def test_partition_values(self):
+        values = partition_values(pd.Series([32.0, np.nan, 2020]))
+        self.assertEqual(values.tolist(), ['32', HIVE_DEFAULT_PARTITION, '2020'])
+
+class ExportFactTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = utils.config._config
+        utils.config._config = {'facts': {'partitioned': False, 'compression': 'zstd'}}
+        self.flats = FlatFiles(self.tmpdir, self.tmpdir)
+
+    def tearDown(self):
+        utils.config._config = self.config
+        shutil.rmtree(self.tmpdir)
+
+    def written_files(self):
+        return sorted(os.path.relpath(os.path.join(root, f), self.tmpdir)
+                      for root, _, files in os.walk(self.tmpdir) for f in files)
+
+    def test_single_file(self):
+        self.flats.export_fact_table(fact_df(), '/conflict_fact/conflict_table')
+
+        self.assertEqual(self.written_files(), ['conflict_fact/conflict_table.parquet'])
+        parquet_file = pq.ParquetFile(self.tmpdir + '/conflict_fact/conflict_table.parquet')
+        self.assertEqual(parquet_file.metadata.row_group(0).column(0).compression, 'ZSTD')
+        table = parquet_file.read()
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.schema.field('measureID').type, pa.int32())
+        self.assertEqual(table.schema.field('locationID').type, DICTIONARY_STRING)
+
+    def test_partitioned(self):
+        utils.config._config['facts']['partitioned'] = True
+        self.flats.export_fact_table(fact_df(), '/conflict_fact/conflict_table')
+
+        self.assertEqual(self.written_files(),
+                         ['conflict_fact/measureID=32/year=2019/conflict_table.parquet',
+                          'conflict_fact/measureID=32/year=2020/conflict_table.parquet',
+                          'conflict_fact/measureID=33/year=' + HIVE_DEFAULT_PARTITION + '/conflict_table.parquet',
+                          'conflict_fact/measureID=' + HIVE_DEFAULT_PARTITION + '/year=2020/conflict_table.parquet'])
+
+        table = pq.read_table(self.tmpdir + '/conflict_fact/measureID=32/year=2020/conflict_table.parquet')
+        self.assertNotIn('measureID', table.column_names)
+        self.assertEqual(table.column('factID').to_pylist(), ['F_0', 'F_4'])
+        self.assertEqual(table.schema.field('dateID').type, pa.int32())
+
+        missing_date = pq.read_table(self.tmpdir + '/conflict_fact/measureID=33/year=' + HIVE_DEFAULT_PARTITION +
+                                     '/conflict_table.parquet')
+        self.assertEqual(missing_date.column('dateID').to_pylist(), [None])
+
+    def test_partitioned_by_year(self):
+        utils.config._config['facts']['partitioned'] = True
+        self.flats.export_fact_table(fact_df(), '/population_fact/population_table', partitions=['year'])
+
+        self.assertEqual(self.written_files(),
+                         ['population_fact/year=2019/population_table.parquet',
+                          'population_fact/year=2020/population_table.parquet',
+                          'population_fact/year=' + HIVE_DEFAULT_PARTITION + '/population_table.parquet'])
+        parquet_file = pq.ParquetFile(self.tmpdir + '/population_fact/year=2020/population_table.parquet')
+        self.assertEqual(parquet_file.metadata.row_group(0).column(0).compression, 'ZSTD')
+        table = parquet_file.read()
+        self.assertEqual(table.column('factID').to_pylist(), ['F_0', 'F_2', 'F_4'])
+        self.assertEqual(table.schema.field('measureID').type, pa.int32())
+
+    def test_not_partitioned(self):
+        utils.config._config['facts']['partitioned'] = True
+        self.flats.export_fact_table(fact_df(), '/vegetation_fact/vegetation_table_2020', partitions=[])
+
+        self.assertEqual(self.written_files(), ['vegetation_fact/vegetation_table_2020.parquet'])
+
+
+if __name__ == '__main__':
+    unittest.main()
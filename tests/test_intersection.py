@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the intersection of two layers of polygons against gpd.overlay(how='intersection').
+"""
+
+import unittest
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point, box
+from utils.intersection import intersect_polygons
+
+def districts():
+    squares = [box(x, y, x + 1, y + 1) for y in range(3) for x in range(3)]
+    return gpd.GeoDataFrame({'GID_2': ['D' + str(i) for i in range(9)], 'name': ['district'] * 9},
+                            geometry=squares, crs='epsg:3857')
+
+def buffers():
+    geometries = [Point(0.5, 0.5).buffer(0.2),        # inside one district
+                  Point(1.0, 1.0).buffer(0.7),        # overlaps 4 districts partially
+                  box(-0.5, 1.9, 3.5, 3.5),           # overlaps the middle row, contains the last row
+                  box(3.0, 0.0, 4.0, 1.0),            # shares only a border with a district
+                  Point(10, 10).buffer(1)]            # intersects no district
+    return gpd.GeoDataFrame({'date': pd.date_range('2020-01-01', periods=5, freq='MS'), 'name': ['buffer'] * 5},
+                            geometry=geometries, crs='epsg:3857')
+
+def sorted_rows(gdf):
+    gdf = gdf.assign(area=gdf.geometry.area)
+    return pd.DataFrame(gdf.drop(columns='geometry')).sort_values(['date', 'GID_2']).reset_index(drop=True)
+
+class IntersectPolygonsTest(unittest.TestCase):
+
+    def test_same_as_overlay(self):
+        result = intersect_polygons(buffers(), districts())
+        expected = gpd.overlay(buffers(), districts(), how='intersection')
+
+        self.assertEqual(sorted(result.columns), sorted(expected.columns))
+        self.assertEqual(result.crs, expected.crs)
+        result_rows, expected_rows = sorted_rows(result), sorted_rows(expected)
+        pd.testing.assert_frame_equal(result_rows.drop(columns='area'), expected_rows[result_rows.columns.drop('area')])
+        np.testing.assert_allclose(result_rows['area'].values, expected_rows['area'].values, rtol=1e-9)
+
+    def test_pairs(self):
+        result = intersect_polygons(buffers(), districts())
+
+        pairs = list(zip(result['date'].dt.month, result['GID_2']))
+        self.assertEqual(pairs, [(1, 'D0'), (2, 'D0'), (2, 'D1'), (2, 'D3'), (2, 'D4'), (3, 'D3'), (3, 'D4'),
+                                 (3, 'D5'), (3, 'D6'), (3, 'D7'), (3, 'D8')])
+        self.assertTrue(result.geometry.iloc[0].equals(buffers().geometry.iloc[0]))
+        self.assertTrue(result.geometry.iloc[8].equals(districts().geometry.iloc[6]))
+
+    def test_no_deprecated_query(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            intersect_polygons(buffers(), districts())
+        self.assertFalse([warning for warning in caught if 'query_bulk' in str(warning.message)])
+
+    def test_no_pairs(self):
+        result = intersect_polygons(buffers().iloc[4:], districts())
+        self.assertEqual(len(result), 0)
+        self.assertIn('GID_2', result.columns)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the order the pipeline runs the modules in and of the modules skipped after a failure.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import pipeline
+from pipeline import selected_modules, execution_order, run_modules
+
+def finished(name):
+    def run(input_path, output_path, cfg):
+        with open(os.path.join(output_path, 'runs.txt'), 'a') as f:
+            f.write(name + '\n')
+    return run
+
+def failed(input_path, output_path, cfg):
+    raise RuntimeError('failed')
+
+FAKE_MODULES = {'location': (finished('location'), []),
+                'price': (finished('price'), ['location']),
+                'population': (failed, []),
+                'demand': (finished('demand'), ['population']),
+                'report': (finished('report'), ['demand', 'price']),
+                'famine': (finished('famine'), [])}
+
+class ExecutionOrderTest(unittest.TestCase):
+
+    def test_selected_modules(self):
+        self.assertEqual(selected_modules({'module': 'population, demand'}), ['population', 'demand'])
+        self.assertEqual(selected_modules({'module': 'all'}), list(pipeline.MODULES))
+        self.assertNotIn('', selected_modules({'module': 'demand,'}))
+
+    def test_dependencies_first(self):
+        order = execution_order(['demand', 'price', 'population', 'location'])
+        self.assertEqual(order, ['population', 'demand', 'location', 'price'])
+
+    def test_dependencies_not_selected(self):
+        self.assertEqual(execution_order(['demand', 'price']), ['demand', 'price'])
+
+    def test_unknown_module(self):
+        with self.assertRaises(ValueError) as error:
+            execution_order(['demand', 'harvest'])
+        self.assertIn('harvest', str(error.exception))
+
+    def test_cycle(self):
+        modules = {'a': (None, ['b']), 'b': (None, ['c']), 'c': (None, ['a'])}
+        with mock.patch.dict(pipeline.MODULES, modules, clear=True):
+            with self.assertRaises(ValueError) as error:
+                execution_order(['a', 'b', 'c'])
+        self.assertIn('a -> b -> c -> a', str(error.exception))
+
+    def test_vegetation_backfill_after_vegetation(self):
+        order = execution_order(selected_modules({'module': 'all'}))
+        self.assertLess(order.index('vegetation'), order.index('vegetation.backfill'))
+
+class RunModulesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        patcher = mock.patch.dict(pipeline.MODULES, FAKE_MODULES, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def runs(self):
+        path = os.path.join(self.tmpdir, 'runs.txt')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return f.read().split()
+
+    def check_failure(self, workers):
+        status = run_modules(['report', 'demand', 'price', 'location', 'population', 'famine'], self.tmpdir,
+                             self.tmpdir, {}, workers)
+
+        self.assertEqual(status, {'location': 'done', 'price': 'done', 'population': 'failed', 'demand': 'skipped',
+                                  'report': 'skipped', 'famine': 'done'})
+        runs = self.runs()
+        self.assertEqual(sorted(runs), ['famine', 'location', 'price'])
+        self.assertLess(runs.index('location'), runs.index('price'))
+
+    def test_skipped_after_failure(self):
+        self.check_failure(1)
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork', 'the fake modules are sent to forked processes')
+    def test_skipped_after_failure_in_processes(self):
+        self.check_failure(3)
+
+    def test_dependency_not_selected(self):
+        status = run_modules(['demand'], self.tmpdir, self.tmpdir, {}, 1)
+        self.assertEqual(status, {'demand': 'done'})
+        self.assertEqual(self.runs(), ['demand'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the zone index statistics against rasterstats.zonal_stats, on a synthetic raster of 3 x 3 blocks with
+polygons crossing the block edges, a polygon too small to hold a pixel centre and blocks that no polygon touches.
+"""
+
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.transform import from_origin
+from rasterstats import zonal_stats
+from shapely.geometry import box, Polygon
+import utils.config
+from utils.zonal import polygon_window
+from utils.zone_index import zone_index, zonal_sums, zonal_sums_stack, zonal_categorical_counts, ZONE_BLOCK_SIZE
+
+WIDTH = 3 * ZONE_BLOCK_SIZE - 300
+HEIGHT = 3 * ZONE_BLOCK_SIZE - 200
+TRANSFORM = from_origin(30, 10, 0.01, 0.01)
+NODATA = -9999
+
+POLYGONS = [box(30.2, 8.0, 33.0, 9.8),                                   # inside the first block
+            box(34.0, 4.0, 36.3, 6.2),                                   # crosses the edges of 4 blocks
+            Polygon([(36.5, 9.5), (40.0, 9.5), (38.0, 5.5)]),            # crosses the edge of 2 blocks
+            box(30.501, 9.501, 30.503, 9.503),                           # holds no pixel centre: empty zone
+            box(30.2, 1.0, 32.0, 3.9)]                                   # last row of blocks, first column
+# No polygon touches the blocks of the last two columns of the last row, east of lon 35.12 and south of lat 4.88
+
+def write_raster(path, data, dtype, nodata):
+    profile = {'driver': 'GTiff', 'dtype': dtype, 'count': 1, 'width': WIDTH, 'height': HEIGHT,
+               'crs': 'epsg:4326', 'transform': TRANSFORM, 'nodata': nodata}
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data.astype(dtype), 1)
+
+def reference(stats_list, key):
+    return np.array([np.nan if stats.get(key) is None else stats[key] for stats in stats_list], dtype=float)
+
+class ZoneIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = utils.config._config
+        utils.config._config = {'cache': {'localdir': self.tmpdir}}
+
+        rng = np.random.RandomState(0)
+        self.values = rng.uniform(0, 100, (HEIGHT, WIDTH))
+        self.values[rng.uniform(size=self.values.shape) < 0.05] = NODATA
+        self.raster = self.tmpdir + '/values.tif'
+        write_raster(self.raster, self.values, 'float64', NODATA)
+
+        self.other = self.tmpdir + '/other.tif'
+        other = rng.uniform(-10, 10, (HEIGHT, WIDTH))
+        other[:, :WIDTH // 2][rng.uniform(size=(HEIGHT, WIDTH // 2)) < 0.5] = NODATA
+        write_raster(self.other, other, 'float64', NODATA)
+
+        self.categories = self.tmpdir + '/categories.tif'
+        write_raster(self.categories, rng.randint(0, 4, (HEIGHT, WIDTH)), 'uint8', 255)
+
+        self.geometries = gpd.GeoSeries(POLYGONS, crs='epsg:4326')
+        self.zones = zone_index(self.geometries, self.raster, 'test', 'polygons')
+
+    def tearDown(self):
+        utils.config._config = self.config
+        shutil.rmtree(self.tmpdir)
+
+    def test_zone_index_cached(self):
+        self.assertEqual(zone_index(self.geometries, self.categories, 'test', 'polygons'), self.zones)
+
+    def test_zonal_sums(self):
+        stats = zonal_sums(self.zones, self.raster, len(POLYGONS))
+        expected = zonal_stats(list(self.geometries), self.raster, stats=['sum', 'count'])
+
+        np.testing.assert_allclose(stats['sum'].values, reference(expected, 'sum'), rtol=1e-9)
+        np.testing.assert_array_equal(stats['count'].values, reference(expected, 'count'))
+        self.assertTrue(np.isnan(stats['sum'].iloc[3]))
+        self.assertEqual(stats['count'].iloc[3], 0)
+
+    def test_zonal_sums_valid_range(self):
+        stats = zonal_sums(self.zones, self.raster, len(POLYGONS), valid_min=20, valid_max=60)
+
+        in_range = self.tmpdir + '/in_range.tif'
+        write_raster(in_range, np.where((self.values >= 20) & (self.values <= 60), self.values, NODATA), 'float64',
+                     NODATA)
+        expected = zonal_stats(list(self.geometries), in_range, stats=['sum', 'count'])
+
+        np.testing.assert_allclose(stats['sum'].values, reference(expected, 'sum'), rtol=1e-9)
+        np.testing.assert_array_equal(stats['count'].values, reference(expected, 'count'))
+
+    def test_zonal_sums_stack(self):
+        stats = zonal_sums_stack(self.zones, {2019: self.raster, 2020: self.other}, len(POLYGONS))
+
+        self.assertEqual(list(stats.columns), [2019, 2020])
+        for name, path in [(2019, self.raster), (2020, self.other)]:
+            expected = zonal_stats(list(self.geometries), path, stats=['sum'])
+            np.testing.assert_allclose(stats[name].values, reference(expected, 'sum'), rtol=1e-9)
+        self.assertTrue(stats.iloc[3].isna().all())
+
+    def test_zonal_categorical_counts(self):
+        stats = zonal_categorical_counts(self.zones, self.categories, len(POLYGONS), [1, 2])
+        expected = zonal_stats(list(self.geometries), self.categories, categorical=True)
+
+        for category in [1, 2]:
+            np.testing.assert_array_equal(stats[category].values, reference(expected, category))
+        np.testing.assert_array_equal(stats['count'].values, [sum(counts.values()) for counts in expected])
+        self.assertTrue(np.isnan(stats[1].iloc[3]))
+        self.assertEqual(stats['count'].iloc[3], 0)
+
+    def test_windowed_categorical_counts(self):
+        geometries = self.geometries.iloc[[1, 2]]
+        with rasterio.open(self.categories) as src:
+            window = polygon_window(src, box(*geometries.total_bounds))
+        zones = zone_index(geometries, self.categories, 'test', 'polygons', window)
+        stats = zonal_categorical_counts(zones, self.categories, len(geometries), [1, 2], window)
+        expected = zonal_stats(list(geometries), self.categories, categorical=True)
+
+        with rasterio.open(zones) as labels:
+            self.assertEqual((labels.width, labels.height), (int(window.width), int(window.height)))
+        for category in [1, 2]:
+            np.testing.assert_array_equal(stats[category].values, reference(expected, category))
+        np.testing.assert_array_equal(stats['count'].values, [sum(counts.values()) for counts in expected])
+
+    def test_untouched_blocks(self):
+        with rasterio.open(self.zones) as zones:
+            labels = zones.read(1)
+        self.assertEqual(labels.shape, (HEIGHT, WIDTH))
+        self.assertFalse(labels[2 * ZONE_BLOCK_SIZE:, ZONE_BLOCK_SIZE:].any())
+        self.assertEqual(set(np.unique(labels)), {0, 1, 2, 3, 5})
+
+
+if __name__ == '__main__':
+    unittest.main()